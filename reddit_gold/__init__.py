@@ -1,12 +1,11 @@
-import json
 from os import path
-import pkg_resources
 
 from pylons.i18n import N_
 
 from r2.lib.configparse import ConfigValue
-from r2.lib.js import DataSource, LocalizedModule, Module
+from r2.lib.js import LocalizedModule, Module
 from r2.lib.plugin import Plugin
+from reddit_gold.tailors import get_tailor_catalogue, TailorsDataSource
 
 
 class Gold(Plugin):
@@ -14,10 +13,16 @@ class Gold(Plugin):
 
     config = {
         ConfigValue.str: [
+            "gold_accounting_snapshot_dir",
             "gold_hostname_file",
             "gold_servername_sr",
+            "snoovatar_rasterizer",
+            "snoovatar_thumbnail_dir",
             "wiki_page_gold_features",
         ],
+        ConfigValue.int: [
+            "snoovatar_thumbnail_cache_size",
+        ],
     }
 
     js = {
@@ -28,12 +33,8 @@ class Gold(Plugin):
 
         "snoovatar": LocalizedModule("snoovatar.js",
             "snoovatar.js",
-            DataSource(
+            TailorsDataSource(
                 wrap="r.snoovatar.initTailors({content})",
-                data=json.load(pkg_resources.resource_stream(
-                    __name__,
-                    "data/tailors.json",
-                )),
             ),
             prefix="snoovatar/",
         ),
@@ -50,8 +51,13 @@ class Gold(Plugin):
            dest='/gold/about')
         mc('/gold/partners', controller='gold', action='partners')
 
+        # /user/:username/snoo.png is routed here too, with its extension
+        # stripped, and served as a thumbnail.
         mc('/user/:username/snoo', controller='gold', action='snoovatar')
+        mc('/user/:username/snoo.svg', controller='gold',
+           action='snoovatar_svg')
         mc("/api/gold/snoovatar", controller='goldapi', action='snoovatar')
+        mc("/api/gold/snoovatars", controller='goldapi', action='snoovatars')
 
     def load_controllers(self):
         from reddit_gold.controllers import GoldController, GoldApiController
@@ -59,8 +65,11 @@ class Gold(Plugin):
         from reddit_gold.server_naming import hooks
         hooks.register_all()
 
-        self.tailors_data = json.load(pkg_resources.resource_stream(
-            __name__,
-            "data/tailors.json",
-        ))
+    @property
+    def tailors_data(self):
+        return get_tailor_catalogue().tailors
+
+    @property
+    def tailor_index(self):
+        return get_tailor_catalogue().index
 
@@ -0,0 +1,340 @@
+import hashlib
+import json
+import re
+import pkg_resources
+
+from xml.etree import cElementTree as ElementTree
+
+from pylons import app_globals as g
+
+from reddit_gold.tailors import get_tailor_catalogue
+from reddit_gold.validators import VSnooColor
+
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+ElementTree.register_namespace("", SVG_NS)
+ElementTree.register_namespace("xlink", XLINK_NS)
+
+SVG_BUNDLE_PATH = "public/static/snoovatar/images/%s/svg_bundle.json"
+
+# these mirror the constants at the top of snoovatar.js
+DEFAULT_COLOR = "#ffffff"
+COLOR_MODIFIER_VALUE = .3
+COLOR_TYPES = ("color", "altColor")
+DEPRECATED_TAILORS = ("body-fill", "head-fill")
+RENAMED_TAILORS = {
+    "body-stroke": "snoo-body",
+    "head-stroke": "snoo-head",
+}
+RENAMED_DRESSINGS = {
+    "body_stroke": "body",
+    "head_stroke": "head",
+}
+
+# elements that paper.js recolors when a color is set on their group
+PAINTED_TAGS = frozenset("{%s}%s" % (SVG_NS, tag) for tag in (
+    "circle", "ellipse", "g", "line", "path", "polygon", "polyline", "rect",
+    "text",
+))
+
+r_url_ref = re.compile(r"url\(#([^)]+)\)")
+
+
+def color_luminance(hex_color, lum):
+    """Lighten or darken a color like helpers.colorLuminance in the JS."""
+    digits = re.sub(r"[^0-9a-fA-F]", "", hex_color)
+    if len(digits) < 6:
+        digits = "".join(c * 2 for c in digits[:3])
+
+    rgb = "#"
+    for i in xrange(3):
+        c = int(digits[i * 2:i * 2 + 2], 16)
+        c = int(round(min(max(0, c + c * lum), 255)))
+        rgb += "%02x" % c
+    return rgb
+
+
+def parse_rules(name):
+    """Parse the coloring rules out of an SVG element's id.
+
+    Returns a list of (depends_on, prop, name, modifier) where depends_on is
+    the "prop::name" key of the local rule this one takes its color from or
+    None for rules the user colors directly. See svgRuleParser in the JS for
+    the naming scheme.
+
+    """
+
+    rules = []
+    for group in name.split("_x26__x26_"):
+        clauses = group.split("::")
+        if len(clauses) == 2:
+            prop, rule_name = clauses
+            rules.append((None, prop, rule_name.split(":")[0], None))
+        elif len(clauses) == 3:
+            parent, prop, rule_name = clauses
+            parent, sep, modifier = parent.partition(":")
+            parent_name, sep, parent_prop = parent.rpartition("-")
+            if not parent_name:
+                continue
+            parent_prop = "fill" if parent_prop == "f" else "stroke"
+            depends_on = "%s::%s" % (parent_prop, parent_name)
+            rules.append((depends_on, prop, rule_name, modifier or None))
+    return rules
+
+
+def convert_legacy_components(components):
+    """Convert components stored as bare dressing names to dicts."""
+    converted = {}
+    for tailor_name, component in (components or {}).iteritems():
+        if tailor_name in DEPRECATED_TAILORS:
+            continue
+        tailor_name = RENAMED_TAILORS.get(tailor_name, tailor_name)
+        if isinstance(component, basestring):
+            component = {
+                "dressingName": RENAMED_DRESSINGS.get(component, component),
+            }
+        converted[tailor_name] = component or {}
+    return converted
+
+
+class Layer(object):
+    """One tailor's dressing, parsed and ready to be recolored."""
+
+    def __init__(self, tailor, svg):
+        self.tailor = tailor
+        self.root = ElementTree.fromstring(svg)
+
+        # elements with coloring rules, by name. like the JS, only the last
+        # element with a given name is colored.
+        self.named = {}
+        self.rules = []
+        for element in self.root.iter():
+            name = element.get("id")
+            rules = parse_rules(name) if name else []
+            if rules:
+                self.named[name] = element
+                self.rules.extend((name, rule) for rule in rules)
+
+    @property
+    def width(self):
+        view_box = self.root.get("viewBox", "").split()
+        return float(view_box[2]) if len(view_box) == 4 else 0
+
+    def paint(self, name, prop, color):
+        """Set the fill or stroke of an element and everything inside it."""
+        prop = "fill" if prop == "fill" else "stroke"
+        for element in self.named[name].iter():
+            if element.tag not in PAINTED_TAGS:
+                continue
+            element.set(prop, color)
+            style = element.get("style")
+            if style:
+                declarations = [d for d in style.split(";")
+                                if d.split(":")[0].strip() != prop]
+                element.set("style", ";".join(declarations))
+
+    def scope_ids(self, prefix):
+        """Prefix ids and references so layers can share a document."""
+        def scoped(match):
+            return "url(#%s%s)" % (prefix, match.group(1))
+
+        href = "{%s}href" % XLINK_NS
+        for element in self.root.iter():
+            for attr, value in element.items():
+                if attr == "id":
+                    element.set(attr, prefix + value)
+                elif attr == href and value.startswith("#"):
+                    element.set(attr, "#" + prefix + value[1:])
+                elif "url(#" in value:
+                    element.set(attr, r_url_ref.sub(scoped, value))
+
+
+class SnoovatarCompositor(object):
+    """Builds a single SVG for a stored snoovatar on the server.
+
+    This follows what snoovatar.js draws on its canvas: dressings are
+    stacked by z-index, flip_x tailors are mirrored across the canvas and
+    each component's colors are applied through the rules encoded in the
+    SVG element ids. Tailors with use_dynamic_color that don't have a color
+    of their own take the snoovatar's snoo_color.
+
+    """
+
+    def __init__(self, tailors, bundles):
+        self.tailors = {tailor["name"]: tailor for tailor in tailors}
+        self.bundles = bundles
+
+        # changes whenever the catalogue or any of the artwork does
+        version = hashlib.sha1(json.dumps(tailors, sort_keys=True))
+        for asset_path in sorted(bundles):
+            version.update(json.dumps(bundles[asset_path], sort_keys=True))
+        self.version = version.hexdigest()
+
+    @classmethod
+    def load(cls):
+        tailors = get_tailor_catalogue().tailors
+        bundles = {}
+        for tailor in tailors:
+            asset_path = tailor["asset_path"]
+            if asset_path not in bundles:
+                bundles[asset_path] = json.loads(pkg_resources.resource_string(
+                    "reddit_gold",
+                    SVG_BUNDLE_PATH % asset_path,
+                ))
+        return cls(tailors, bundles)
+
+    def digest(self, snoovatar):
+        """Return a hash of everything that affects the composed SVG."""
+        key = json.dumps([
+            snoovatar.get("components"),
+            snoovatar.get("snoo_color"),
+            self.version,
+        ], sort_keys=True)
+        return hashlib.sha1(key).hexdigest()
+
+    def _layers(self, components):
+        layers = []
+        for tailor_name, component in components.iteritems():
+            tailor = self.tailors.get(tailor_name)
+            dressing = component.get("dressingName")
+            if not tailor or not dressing:
+                continue
+
+            svg = self.bundles[tailor["asset_path"]].get(dressing)
+            if svg:
+                layers.append(Layer(tailor, svg.encode("utf-8")))
+
+        layers.sort(key=lambda layer: layer.tailor["z-index"])
+        return layers
+
+    def _colors(self, components, snoo_color):
+        """Return (tailor name, color type, color) for each color to apply.
+
+        Anything that isn't a hex color is treated as if it weren't set.
+
+        """
+
+        def valid(color):
+            if (isinstance(color, basestring) and
+                    VSnooColor.r_hex_color.match(color)):
+                return color
+            return None
+
+        colors = []
+        for tailor_name in sorted(components,
+                key=lambda name: self.tailors[name]["z-index"]):
+            component = components[tailor_name]
+            tailor = self.tailors[tailor_name]
+            for color_type in COLOR_TYPES:
+                color = valid(component.get(color_type))
+                if (not color and color_type == "color" and
+                        tailor["use_dynamic_color"]):
+                    color = valid(snoo_color) or DEFAULT_COLOR
+                if color:
+                    colors.append((tailor_name, color_type, color))
+        return colors
+
+    def compose(self, snoovatar):
+        components = convert_legacy_components(snoovatar.get("components"))
+        components = {name: component
+                      for name, component in components.iteritems()
+                      if name in self.tailors}
+        layers = self._layers(components)
+
+        # "prop::name" -> [(layer, element name, prop)] for rules the user
+        # colors, and -> [(layer, element name, prop, modifier)] for rules
+        # that follow them, both in the order snoovatar.js would find them.
+        local = {}
+        local_order = []
+        depends_on = {}
+        for layer in layers:
+            for name, (parent, prop, rule_name, modifier) in layer.rules:
+                if parent:
+                    depends_on.setdefault(parent, []).append(
+                        (layer, name, prop, modifier))
+                    continue
+                key = "%s::%s" % (prop, rule_name)
+                if key not in local:
+                    local[key] = []
+                    local_order.append(key)
+                local[key].append((layer, name, prop))
+
+        # the user facing colors of each tailor: [0] is color and [1] is
+        # altColor.
+        adjustable = {}
+        for key in local_order:
+            for layer, name, prop in local[key]:
+                keys = adjustable.setdefault(layer.tailor["name"], [])
+                if key not in keys:
+                    keys.append(key)
+
+        for tailor_name, color_type, color in self._colors(
+                components, snoovatar.get("snoo_color")):
+            keys = adjustable.get(tailor_name, [])
+            index = COLOR_TYPES.index(color_type)
+            if index >= len(keys):
+                continue
+            key = keys[index]
+
+            for layer, name, prop in local[key]:
+                if layer.tailor["name"] == tailor_name:
+                    layer.paint(name, prop, color)
+
+            for layer, name, prop, modifier in depends_on.get(key, []):
+                if modifier == "darker":
+                    layer.paint(name, prop, color_luminance(
+                        color, -COLOR_MODIFIER_VALUE))
+                elif modifier == "lighter":
+                    layer.paint(name, prop, color_luminance(
+                        color, COLOR_MODIFIER_VALUE))
+                else:
+                    layer.paint(name, prop, color)
+
+        size = max([layer.width for layer in layers] or [400])
+        root = ElementTree.Element("{%s}svg" % SVG_NS, {
+            "version": "1.1",
+            "viewBox": "0 0 %g %g" % (size, size),
+            "width": "%g" % size,
+            "height": "%g" % size,
+        })
+        for layer in layers:
+            layer.scope_ids(layer.tailor["name"] + "-")
+            group = ElementTree.SubElement(root, "{%s}g" % SVG_NS)
+            if layer.tailor["flip_x"]:
+                group.set("transform", "matrix(-1 0 0 1 %g 0)" % layer.width)
+            group.extend(list(layer.root))
+        return ElementTree.tostring(root, encoding="utf-8")
+
+
+_compositor = None
+
+
+def get_compositor():
+    """Return the compositor, loading the artwork the first time it's
+    needed."""
+    global _compositor
+
+    if _compositor is None:
+        _compositor = SnoovatarCompositor.load()
+    return _compositor
+
+
+# composed SVGs are keyed by content so they never go stale
+SVG_CACHE_TIME = 86400
+
+
+def get_snoovatar_svg(snoovatar):
+    """Return (digest, svg) for a snoovatar, composing it if necessary."""
+    compositor = get_compositor()
+    digest = compositor.digest(snoovatar)
+    key = "snoovatar-svg:" + digest
+
+    svg = g.cache.get(key)
+    if svg is None:
+        g.stats.simple_event("snoovatar.svg.cache.miss")
+        svg = compositor.compose(snoovatar)
+        g.cache.set(key, svg, time=SVG_CACHE_TIME)
+    else:
+        g.stats.simple_event("snoovatar.svg.cache.hit")
+    return digest, svg
@@ -2,14 +2,14 @@ import json
 
 from pylons import tmpl_context as c
 from pylons import app_globals as g
-from pylons import response
+from pylons import request, response
 from pylons.i18n import _
 
 from r2.config import feature
 from r2.controllers import add_controller
 from r2.controllers.reddit_base import RedditController
+from r2.lib.base import abort
 from r2.lib.errors import errors
-from r2.lib.require import require, RequirementException
 from r2.lib.validator import (
     json_validate,
     validate,
@@ -17,16 +17,25 @@ from r2.lib.validator import (
     VBoolean,
     VExistingUname,
     VGold,
+    VInt,
     VJSON,
     VModhash,
+    nop,
     VUser,
 )
+from r2.models import Account
+from reddit_gold.compositor import get_compositor, get_snoovatar_svg
 from reddit_gold.models import SnoovatarsByAccount
 from reddit_gold.pages import (
     GoldInfoPage,
     Snoovatar,
     SnoovatarProfilePage,
 )
+from reddit_gold.thumbnails import (
+    get_snoovatar_png,
+    RasterizeError,
+    THUMBNAIL_SIZES,
+)
 from reddit_gold.validators import VSnooColor
 
 
@@ -44,8 +53,14 @@ class GoldController(RedditController):
 
     @validate(
         vuser=VExistingUname("username"),
+        size=VInt("size", num_default=THUMBNAIL_SIZES[-1]),
     )
-    def GET_snoovatar(self, vuser):
+    def GET_snoovatar(self, vuser, size):
+        # r2 strips the extension off /user/:username/snoo.png before
+        # routing, so thumbnail requests end up here too.
+        if c.render_style == "png":
+            return self._snoovatar_png(vuser, size)
+
         if not vuser or vuser._deleted or not vuser.gold:
             self.abort404()
 
@@ -65,6 +80,60 @@ class GoldController(RedditController):
             ),
         ).render()
 
+    def _public_snoovatar(self, vuser):
+        """Return vuser's snoovatar if c.user may see it, or 404."""
+        if not vuser or vuser._deleted or not vuser.gold:
+            self.abort404()
+
+        snoovatar = SnoovatarsByAccount.load(vuser, "snoo")
+
+        user_is_owner = c.user_is_loggedin and c.user == vuser
+        if not snoovatar or not (snoovatar["public"] or user_is_owner):
+            self.abort404()
+        return snoovatar
+
+    def _not_modified(self, etag):
+        response.headers["ETag"] = '"%s"' % etag
+        if etag in request.if_none_match:
+            response.status_int = 304
+            return True
+        return False
+
+    @validate(
+        vuser=VExistingUname("username"),
+    )
+    def GET_snoovatar_svg(self, vuser):
+        snoovatar = self._public_snoovatar(vuser)
+
+        # the etag is a hash of everything that goes into the image, so
+        # revalidation doesn't need to compose or fetch it.
+        etag = get_compositor().digest(snoovatar)
+        if self._not_modified(etag):
+            return ""
+
+        etag, svg = get_snoovatar_svg(snoovatar)
+        response.content_type = "image/svg+xml"
+        return svg
+
+    def _snoovatar_png(self, vuser, size):
+        if size not in THUMBNAIL_SIZES:
+            self.abort404()
+
+        snoovatar = self._public_snoovatar(vuser)
+
+        etag = "%s-%d" % (get_compositor().digest(snoovatar), size)
+        if self._not_modified(etag):
+            return ""
+
+        try:
+            digest, png = get_snoovatar_png(snoovatar, size)
+        except RasterizeError as e:
+            g.log.warning("failed to rasterize snoovatar for %s: %s",
+                          vuser.name, e)
+            abort(503)
+        response.content_type = "image/png"
+        return png
+
 
 @add_controller
 class GoldApiController(RedditController):
@@ -77,6 +146,35 @@ class GoldApiController(RedditController):
         response.content_type = "application/json"
         return json.dumps(snoovatar)
 
+    MAX_SNOOVATAR_NAMES = 500
+
+    @validate(
+        names=nop("names"),
+    )
+    def GET_snoovatars(self, names):
+        """Get the public snoovatars of a comma-separated list of users.
+
+        Only the first MAX_SNOOVATAR_NAMES names are looked up.
+
+        """
+
+        names = filter(None, (names or "").split(","))
+        names = names[:self.MAX_SNOOVATAR_NAMES]
+
+        account_ids = Account._names_to_ids(names, ignore_missing=True)
+        accounts = Account._byID(account_ids, data=True, return_dict=False)
+        accounts = [a for a in accounts if not a._deleted and a.gold]
+
+        snoovatars = SnoovatarsByAccount.load_multi(accounts, "snoo")
+        public = {}
+        for account in accounts:
+            snoovatar = snoovatars.get(account._id36)
+            if snoovatar and snoovatar["public"]:
+                public[account.name] = snoovatar
+
+        response.content_type = "application/json"
+        return json.dumps(public)
+
     @validatedForm(
         VUser(),
         VGold(),
@@ -95,30 +193,9 @@ class GoldApiController(RedditController):
         if form.has_errors("snoo_color", errors.BAD_CSS_COLOR):
             return
 
-        try:
-            tailors = g.plugins["gold"].tailors_data
-            validated = {}
-
-            for tailor in tailors:
-                tailor_name = tailor["name"]
-
-                component = unvalidated_components.get(tailor_name)
-
-                # if the tailor requires a selection, ensure there is one
-                if not tailor["allow_clear"]:
-                    require(component)
-
-                # ensure this dressing exists
-                dressing = component.get("dressingName")
-                if dressing:
-                    for d in tailor["dressings"]:
-                        if dressing == d["name"]:
-                            break
-                    else:
-                        raise RequirementException
-
-                validated[tailor_name] = component
-        except RequirementException:
+        tailor_index = g.plugins["gold"].tailor_index
+        validated = tailor_index.validate(unvalidated_components)
+        if validated is None:
             c.errors.add(errors.INVALID_SNOOVATAR, field="components")
             form.has_errors("components", errors.INVALID_SNOOVATAR)
             return
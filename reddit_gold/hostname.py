@@ -0,0 +1,45 @@
+import json
+import os
+import time
+
+
+class GoldHostnameFile(object):
+    """The server name written by get-server-name.py, cached in-process.
+
+    The file is only stat'd once every check_interval seconds and is only
+    re-read and re-parsed when its inode, mtime or size change.
+
+    """
+
+    def __init__(self, path, check_interval=1):
+        self.path = path
+        self.check_interval = check_interval
+        self.hostname = ""
+        self._next_check = 0
+        self._file_id = None
+
+    def get(self):
+        now = time.time()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._refresh()
+        return self.hostname
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._file_id = None
+            self.hostname = ""
+            return
+
+        file_id = (stat.st_ino, stat.st_mtime, stat.st_size)
+        if file_id == self._file_id:
+            return
+
+        try:
+            with open(self.path) as f:
+                self.hostname = json.loads(f.read().strip())
+        except (IOError, ValueError):
+            self.hostname = ""
+        self._file_id = file_id
@@ -1,10 +1,14 @@
 import json
+import time
 
 from pylons import app_globals as g
+from r2.config import feature
 from r2.models import Frontpage
-from r2.models.wiki import WikiPageIniItem
+from r2.models.wiki import WikiPage, WikiPageIniItem
 from r2.lib.db import tdb_cassandra
 
+from reddit_gold.tailors import get_tailor_catalogue
+
 
 class GoldFeature(WikiPageIniItem):
     """Information about reddit gold features."""
@@ -21,6 +25,38 @@ class GoldFeature(WikiPageIniItem):
         self.image_url = image_url
         self.is_enabled = is_enabled
         self.is_new = is_new
+        self.extra_classes = 'new' if is_new else ''
+
+    # how often, in seconds, to check the wiki page for a new revision
+    REVISION_CHECK_INTERVAL = 60
+    _cached = None
+    _next_revision_check = 0
+
+    @classmethod
+    def get_revision(cls):
+        sr, page_name = cls._get_wiki_config()
+        try:
+            return WikiPage.get(sr, page_name).revision
+        except tdb_cassandra.NotFound:
+            return None
+
+    @classmethod
+    def get_all_cached(cls):
+        """Return (revision, features) for the current wiki page revision.
+
+        The parsed features are kept in-process and only re-parsed when the
+        page's revision changes, which is checked at most once every
+        REVISION_CHECK_INTERVAL seconds.
+
+        """
+
+        now = time.time()
+        if cls._cached is None or now >= cls._next_revision_check:
+            cls._next_revision_check = now + cls.REVISION_CHECK_INTERVAL
+            revision = cls.get_revision()
+            if cls._cached is None or cls._cached[0] != revision:
+                cls._cached = (revision, cls.get_all())
+        return cls._cached
 
 
 class SnoovatarsByAccount(tdb_cassandra.View):
@@ -31,23 +67,113 @@ class SnoovatarsByAccount(tdb_cassandra.View):
         "default_validation_class": "UTF8Type",
     }
 
+    # decoded snoovatars are cached in memcache. users without one are
+    # cached as {} so they don't fall through to cassandra either.
+    CACHE_TIME = 86400
+
     @classmethod
-    def load(cls, user, name):
+    def _cache_key(cls, user, name):
+        return "snoovatar:%s:%s" % (user._id36, name)
+
+    @classmethod
+    def _pack_rows(cls):
+        """Whether rows are written packed rather than as json.
+
+        App servers from before the packed encoding can't read it, so this
+        stays off until none of them are left running. Packed and json rows
+        are both read whether it's on or not.
+
+        """
+
+        return feature.is_enabled("snoovatar_packed_storage")
+
+    @classmethod
+    def _decode(cls, id36, name, raw, repack=True):
+        """Decode a stored snoovatar, repacking it if it's still json."""
+        codec = get_tailor_catalogue().codec
+        snoovatar = codec.decode(raw)
+
+        if repack and not codec.is_packed(raw) and cls._pack_rows():
+            packed = codec.encode(snoovatar)
+            if codec.is_packed(packed):
+                cls._set_values(id36, {name: packed})
+                g.stats.simple_event("snoovatar.repacked")
+
+        return snoovatar
+
+    @classmethod
+    def _load_uncached(cls, user, name):
         try:
             data = cls._byID(user._id36, properties=[name])
         except tdb_cassandra.NotFound:
             return {}
 
-        raw_json = data[name]
-        return json.loads(raw_json)
+        return cls._decode(user._id36, name, data[name])
+
+    @classmethod
+    def load(cls, user, name):
+        key = cls._cache_key(user, name)
+        snoovatar = g.cache.get(key)
+        if snoovatar is not None:
+            g.stats.simple_event("snoovatar.cache.hit")
+            return snoovatar
+
+        g.stats.simple_event("snoovatar.cache.miss")
+        snoovatar = cls._load_uncached(user, name)
+        g.cache.set(key, snoovatar, time=cls.CACHE_TIME)
+        return snoovatar
+
+    @classmethod
+    def load_multi(cls, users, name):
+        """Return a dict of user._id36 -> snoovatar for many users at once."""
+        keys = {user._id36: cls._cache_key(user, name) for user in users}
+        cached = g.cache.get_multi(keys.values())
+
+        snoovatars = {}
+        missing = []
+        for id36, key in keys.iteritems():
+            if key in cached:
+                snoovatars[id36] = cached[key]
+            else:
+                missing.append(id36)
+
+        g.stats.simple_event("snoovatar.cache.hit", delta=len(snoovatars))
+        g.stats.simple_event("snoovatar.cache.miss", delta=len(missing))
+
+        if missing:
+            rows = cls._byID(missing, properties=[name])
+            to_cache = {}
+            for id36 in missing:
+                data = rows.get(id36)
+                if data:
+                    # rows are repacked when they're loaded one at a time,
+                    # rather than with a write per row here.
+                    snoovatar = cls._decode(id36, name, data[name],
+                                            repack=False)
+                else:
+                    snoovatar = {}
+                snoovatars[id36] = snoovatar
+                to_cache[keys[id36]] = snoovatar
+            g.cache.set_multi(to_cache, time=cls.CACHE_TIME)
+
+        return snoovatars
 
     @classmethod
     def save(cls, user, name, public, snoo_color, components):
-        cls._set_values(user._id36, {name: json.dumps({
+        snoovatar = {
             "public": public,
             "snoo_color": snoo_color,
             "components": components,
-        })})
+        }
+        codec = get_tailor_catalogue().codec
+        if cls._pack_rows():
+            raw = codec.encode(snoovatar)
+        else:
+            raw = json.dumps(snoovatar)
+        # cache what a load would decode so normalized colors match
+        snoovatar = codec.decode(raw)
+        cls._set_values(user._id36, {name: raw})
+        g.cache.set(cls._cache_key(user, name), snoovatar, time=cls.CACHE_TIME)
 
         if user.pref_show_snoovatar != public:
             user.pref_show_snoovatar = public
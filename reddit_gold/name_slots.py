@@ -0,0 +1,97 @@
+import heapq
+import os
+import threading
+
+
+SERVER_NAMES_ROOT = "/gold/server-names"
+
+
+class NoSlotsAvailable(Exception):
+    pass
+
+
+class NameSlots(object):
+    """The server name slots in ZooKeeper, kept current by watches.
+
+    Every slot is read once when this is created and ChildrenWatch/DataWatch
+    keep the local copy up to date after that, so handing out a slot doesn't
+    need to talk to ZooKeeper. Slots are handed out from a heap preferring
+    empty ones and then the least recently modified.
+
+    client can be anything implementing get_children/get/set/ChildrenWatch/
+    DataWatch like a KazooClient does.
+
+    """
+
+    def __init__(self, client, root=SERVER_NAMES_ROOT):
+        self.client = client
+        self.root = root
+        self.lock = threading.RLock()
+
+        # slot name -> (has_data, mtime). the heap holds the same tuples
+        # with the slot name appended and may contain stale entries.
+        self.slots = {}
+        self.heap = []
+
+        self.client.ChildrenWatch(self.root, self._on_children_change)
+
+    def _path(self, slot_name):
+        return os.path.join(self.root, slot_name)
+
+    def _update(self, slot_name, data, mtime):
+        key = (bool(data), mtime)
+        self.slots[slot_name] = key
+        heapq.heappush(self.heap, key + (slot_name,))
+
+    def _on_children_change(self, children):
+        with self.lock:
+            for slot_name in set(self.slots) - set(children):
+                del self.slots[slot_name]
+
+            for slot_name in children:
+                if slot_name not in self.slots:
+                    self._watch(slot_name)
+
+    def _watch(self, slot_name):
+        # DataWatch calls us right away with the current data, so the slot
+        # is known about before this returns.
+        self.slots[slot_name] = None
+
+        def on_data_change(data, stat):
+            with self.lock:
+                if slot_name not in self.slots:
+                    # the slot went away, stop watching it.
+                    return False
+
+                if stat is None:
+                    del self.slots[slot_name]
+                    return False
+
+                self._update(slot_name, data, stat.mtime)
+
+        self.client.DataWatch(self._path(slot_name), on_data_change)
+
+    def assign(self, data):
+        """Write data to the best available slot and return the slot's path."""
+        with self.lock:
+            while self.heap:
+                entry = heapq.heappop(self.heap)
+                slot_name = entry[-1]
+                if self.slots.get(slot_name) == entry[:-1]:
+                    break
+            else:
+                raise NoSlotsAvailable
+
+            path = self._path(slot_name)
+            try:
+                stat = self.client.set(path, data)
+            except Exception:
+                # the slot is still there as far as we know, put it back so
+                # it can be handed out again.
+                heapq.heappush(self.heap, entry)
+                raise
+
+            # don't wait for the watch to fire before this slot stops being
+            # the best candidate.
+            self._update(slot_name, data, stat.mtime)
+            return path
@@ -1,7 +1,7 @@
 from pylons import app_globals as g
 
 from r2.lib.pages import BoringPage, ProfilePage
-from r2.lib.wrapped import Templated
+from r2.lib.wrapped import CachedTemplate, Templated
 from reddit_gold.models import GoldFeature
 
 
@@ -11,16 +11,27 @@ class GoldInfoPage(BoringPage):
             "gold_month_price": g.gold_month_price,
             "gold_year_price": g.gold_year_price,
         }
-        self.features = []
-
-        all_features = GoldFeature.get_all()
-        for feature in all_features:
-            feature.extra_classes = 'new' if feature.is_new else ''
-            self.features.append(feature)
+        revision, features = GoldFeature.get_all_cached()
+        self.feature_list = GoldFeatureList(revision=revision)
 
         BoringPage.__init__(self, *args, **kwargs)
 
 
+class GoldFeatureList(CachedTemplate):
+    """The features section of /gold/about, cached by wiki page revision."""
+
+    def __init__(self, revision):
+        self.revision = revision
+        CachedTemplate.__init__(self)
+
+    @property
+    def features(self):
+        # only needed when the render cache misses, so it isn't part of the
+        # cache key.
+        revision, features = GoldFeature.get_all_cached()
+        return features
+
+
 class SnoovatarProfilePage(ProfilePage):
     extra_stylesheets = ['gold.less']
 
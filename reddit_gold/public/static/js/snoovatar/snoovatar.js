@@ -3,7 +3,7 @@
   var exports = r.snoovatar;
 
   // config values
-  var imagePath = '/static/snoovatar/images/';
+  var spritePath = '/static/snoovatar/';
   var canvasSize = 400;
   var pixelRatio = 2;
   var snooBaseTailor = 'snoo-body';
@@ -61,40 +61,36 @@
   }
 
   /**
-   * returns a promise that resolves when an array of image sources are preloaded
-   * @param  {string[]} sources list of svg bundles to load}
+   * returns a promise that resolves when an array of sprite bundles are preloaded
+   * @param  {Object[]} sprites list of sprite bundles to load, from tailors.json data
    * @return {$.Promise}
-   * @resolve {JSON with SVG}
+   * @resolve {Object[]} the SVGs in each bundle, keyed by asset path and dressing
    */
-  $.preloadSVGs = function(sources) {
-    return $.when.apply(window, $.map(sources, function(src) {
-      var isJson = _.isObject(src);
+  $.preloadSVGs = function(sprites) {
+    return $.when.apply(window, $.map(sprites, function(sprite) {
       var def = $.Deferred();
       r.ajax({
-        url: src.url,
-        type: 'GET'
+        url: spritePath + sprite.name,
+        type: 'GET',
+        // bundle names change with their contents, so they can be cached forever
+        cache: true
       })
         .done(function(data, textStatus, jqXHR) {
-          var data = jqXHR.responseText;
-          if (isJson) {
-            try {
-              data = window.JSON.parse(data);
-            } catch (e) {}
+          try {
+            data = window.JSON.parse(jqXHR.responseText);
+          } catch (e) {
+            data = null;
           }
-
-          def.resolve({
-            tailor: src.tailor,
-            data: data
-          });
+          def.resolve(data);
         })
         .fail(function(jqXHR, textStatus, errorThrown) {
-          def.resolve({
-            tailor: src.tailor,
-            data: null
-          });
+          def.resolve(null);
         });
       return def.promise();
-    }));
+    }))
+      .then(function() {
+        return _.compact(arguments);
+      });
   };
 
   /**
@@ -104,7 +100,7 @@
    * @return {object}
    */
   exports.initTailors = bond(function(data) {
-    data.sort(function(a, b) {
+    data.tailors.sort(function(a, b) {
       a = a['z-index'];
       b = b['z-index'];
       return a - b;
@@ -152,7 +148,9 @@
     });
 
   /**
-   * promise that is resolved when SVGs derived from tailors.json are loaded
+   * promise that is resolved when the sprite bundles needed for the first draw
+   * are loaded. if the build split out a critical bundle with the default look
+   * that's all we wait for; the rest are loaded after the builder is created.
    * @type {$.Promise}
    * @resolve {SVGs[]}
    */
@@ -160,17 +158,7 @@
     exports.initTailors.isReady
   )
     .then(function(tailorData) {
-      var svgBundlesToLoad = _.chain(tailorData)
-        .pluck('asset_path')
-        .map(function(tailor) {
-          return {
-            tailor: tailor,
-            url: imagePath + tailor + '/svg_bundle.json'
-          }
-        })
-        .value();
-
-      return $.preloadSVGs(svgBundlesToLoad);
+      return $.preloadSVGs(helpers.splitSprites(tailorData.sprites).initial);
     });
 
   /**
@@ -184,25 +172,12 @@
     exports.initSnoovatar.isReady
   )
     .then(function buildSvgMap(svgs, tailorData, snoovatarData) {
-      // transform map to object literal for easier lookup
-      var svgMap = _.reduce(svgs, function(aggr, svg) {
-        aggr[svg.tailor] = svg.data;
-        return aggr;
-      }, {});
-
-      var tailors = _.reduce(tailorData, function(memo, obj) {
-        obj.dressings = _.reduce(obj.dressings || [], function(aggr, dressing) {
-          if (dressing.name) {
-            dressing.svg = svgMap[obj.asset_path][dressing.name];
-          }
-          aggr.push(dressing);
-          return aggr;
-        }, []);
-
+      var tailors = _.reduce(tailorData.tailors, function(memo, obj) {
+        obj.dressings = obj.dressings || [];
         memo[obj.name] = obj;
-
         return memo;
       }, {});
+      helpers.addSvgs(tailors, svgs);
 
       return {
         tailors: tailors,
@@ -212,7 +187,7 @@
     });
 
   // build UI and bind event handlers
-  $.when(
+  var builderReady = $.when(
     svgTailorsReady,
     viewReady
   )
@@ -226,6 +201,21 @@
       return r.snooBuilder;
     });
 
+  // load the sprites left out of the first draw and redraw with them
+  $.when(
+    builderReady,
+    exports.initTailors.isReady
+  )
+    .then(function loadLazySprites(builder, tailorData) {
+      var lazySprites = helpers.splitSprites(tailorData.sprites).lazy;
+      if (lazySprites.length) {
+        $.preloadSVGs(lazySprites).then(function(svgs) {
+          helpers.addSvgs(builder.tailors, svgs);
+          builder.draw();
+        });
+      }
+    });
+
   function initSnooBuilder(options) {
     var obj = {
       _svgNameSeparator: '::::',
@@ -801,6 +791,32 @@
   }
 
   var helpers = {
+    // splits sprite bundles into those needed for the first draw and the rest
+    splitSprites: function(sprites) {
+      var critical = _.where(sprites, { critical: true });
+      if (!critical.length) {
+        return { initial: sprites, lazy: [] };
+      }
+      return {
+        initial: critical,
+        lazy: _.where(sprites, { critical: false })
+      };
+    },
+
+    // attaches SVG sources from loaded sprite bundles to tailors' dressings
+    addSvgs: function(tailors, svgs) {
+      _.each(svgs, function(bundle) {
+        _.each(tailors, function(tailor) {
+          var assetSvgs = bundle[tailor.asset_path] || {};
+          _.each(tailor.dressings, function(dressing) {
+            if (dressing.name && assetSvgs[dressing.name]) {
+              dressing.svg = assetSvgs[dressing.name];
+            }
+          });
+        });
+      });
+    },
+
     colorLuminance: function(hex, lum) {
       // validate hex string
       hex = window.String(hex).replace(/[^0-9a-f]/gi, '');
@@ -1,16 +1,21 @@
 import datetime
-import json
+import time
+
+from array import array
+from bisect import bisect_left
 
 from pylons import tmpl_context as c
 from pylons import app_globals as g
 from sqlalchemy.sql.expression import select, distinct, func
 
 from r2.lib.base import abort
+from r2.lib.db.thing import NotFound
 from r2.lib.errors import errors
 from r2.lib.hooks import HookRegistrar
 from r2.lib.memoize import memoize
 from r2.models import Subreddit, Link, Comment
 from r2.models.gold import gold_table, ENGINE, TIMEZONE
+from reddit_gold.hostname import GoldHostnameFile
 
 
 hooks = HookRegistrar()
@@ -33,28 +38,150 @@ def gold_buyers_on(date):
     return [int(account_id) for (account_id,) in rows.fetchall() if account_id]
 
 
-def gold_buyers_yesterday():
+class GoldBuyerIndex(object):
+    """A compact, sorted set of the account ids that bought gold on a day.
+
+    Membership checks are a binary search over a flat array so they neither
+    scan the list nor allocate.
+
+    """
+
+    __slots__ = ("account_ids",)
+
+    def __init__(self, account_ids):
+        self.account_ids = array("l", sorted(set(account_ids)))
+
+    def __contains__(self, account_id):
+        i = bisect_left(self.account_ids, account_id)
+        return (i != len(self.account_ids) and
+                self.account_ids[i] == account_id)
+
+    def __len__(self):
+        return len(self.account_ids)
+
+    def __iter__(self):
+        return iter(self.account_ids)
+
+
+class ExpiringCache(object):
+    """A small per-process dict whose entries expire after ttl seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry and entry[0] > time.time():
+            return entry[1]
+        return default
+
+    def set(self, key, value):
+        now = time.time()
+
+        # throw away entries nobody's asked about recently
+        for stale_key, (expires, _) in self.entries.items():
+            if expires <= now:
+                del self.entries[stale_key]
+
+        self.entries[key] = (now + self.ttl, value)
+
+
+# per-process indexes shared across requests, keyed by date
+_buyer_indexes = ExpiringCache(ttl=300)
+
+
+def gold_buyer_index_on(date):
+    """Return a GoldBuyerIndex of the people who bought gold on date.
+
+    The index is built once per process and rebuilt from the memoized
+    gold_buyers_on list whenever it expires so updates to the memoized
+    value are picked up.
+
+    """
+
+    index = _buyer_indexes.get(date)
+    if index is None:
+        index = GoldBuyerIndex(gold_buyers_on(date))
+        _buyer_indexes.set(date, index)
+    return index
+
+
+# the server naming subreddit's id by name. a missing subreddit is cached as
+# NO_SUBREDDIT so votes don't keep looking it up.
+_servername_sr_ids = ExpiringCache(ttl=300)
+NO_SUBREDDIT = object()
+
+
+def servername_sr_id():
+    """Return the id of the server naming subreddit, or None."""
+    name = g.gold_servername_sr
+    if not name:
+        return None
+
+    sr_id = _servername_sr_ids.get(name)
+    if sr_id is None:
+        try:
+            sr_id = Subreddit._by_name(name)._id
+        except NotFound:
+            sr_id = NO_SUBREDDIT
+        _servername_sr_ids.set(name, sr_id)
+
+    if sr_id is NO_SUBREDDIT:
+        return None
+    return sr_id
+
+
+# (revenue_date, server_names) of links in the server naming subreddit
+_servername_links = ExpiringCache(ttl=60)
+
+
+def servername_link_state(link_id):
+    """Return (revenue_date, server_names) for a server naming thread.
+
+    revenue_date is None for links that aren't automated naming threads.
+
+    """
+
+    state = _servername_links.get(link_id)
+    if state is None:
+        link = Link._byID(link_id, data=True)
+        state = (getattr(link, "revenue_date", None),
+                 getattr(link, "server_names", None))
+        _servername_links.set(link_id, state)
+    return state
+
+
+def yesterday():
     one_day = datetime.timedelta(days=1)
-    yesterday = datetime.datetime.now(TIMEZONE).date() - one_day
-    return gold_buyers_on(yesterday)
+    return datetime.datetime.now(TIMEZONE).date() - one_day
+
+
+def gold_buyers_yesterday():
+    return gold_buyers_on(yesterday())
+
+
+_gold_hostname_file = None
 
 
 @hooks.on("reddit.request.begin")
 def add_gold_hostname():
-    c.gold_hostname = ""
+    global _gold_hostname_file
 
-    if g.gold_hostname_file:
-        try:
-            with open(g.gold_hostname_file) as f:
-                c.gold_hostname = json.loads(f.read().strip())
-        except (IOError, ValueError):
-            pass
+    if not g.gold_hostname_file:
+        c.gold_hostname = ""
+        return
+
+    if not _gold_hostname_file:
+        _gold_hostname_file = GoldHostnameFile(g.gold_hostname_file)
+    c.gold_hostname = _gold_hostname_file.get()
 
 
 @hooks.on("subreddit.can_comment")
 def nameaserver_can_comment(sr, user):
     if sr.name == g.gold_servername_sr:
-        return sr.is_moderator(user) or user._id in gold_buyers_yesterday()
+        return (sr.is_moderator(user) or
+                user._id in gold_buyer_index_on(yesterday()))
 
 
 @hooks.on("comment.validate")
@@ -69,18 +196,17 @@ def nameaserver_comment_lockdown(sr, link, parent_comment):
 
 @hooks.on("vote.validate")
 def nameaserver_vote_lockdown(thing):
-    if getattr(thing, "sr_id", None):
-        sr = Subreddit._byID(thing.sr_id, data=True)
-        if sr.name == g.gold_servername_sr:
-            if isinstance(thing, Link):
-                # no votes on links in this subreddit
+    sr_id = getattr(thing, "sr_id", None)
+    if sr_id and sr_id == servername_sr_id():
+        if isinstance(thing, Link):
+            # no votes on links in this subreddit
+            abort(403, "Forbidden")
+        elif isinstance(thing, Comment):
+            # only allow votes on comments in active threads by people
+            # who bought gold.
+            revenue_date, server_names = servername_link_state(thing.link_id)
+
+            if (revenue_date and
+                (server_names or
+                 c.user._id not in gold_buyer_index_on(revenue_date))):
                 abort(403, "Forbidden")
-            elif isinstance(thing, Comment):
-                # only allow votes on comments in active threads by people
-                # who bought gold.
-                link = Link._byID(thing.link_id, data=True)
-
-                if (hasattr(link, "revenue_date") and
-                    (link.server_names or
-                     c.user._id not in gold_buyers_on(link.revenue_date))):
-                    abort(403, "Forbidden")
@@ -0,0 +1,227 @@
+import base64
+import json
+import re
+import struct
+import zlib
+
+from reddit_gold.validators import VSnooColor
+
+
+def name_id(name):
+    """A stable 32-bit id for a tailor or dressing name."""
+    return zlib.crc32(name.encode("utf-8")) & 0xffffffff
+
+
+class SnoovatarCodec(object):
+    """Packs stored snoovatars into a compact binary form.
+
+    Version 1 rows are base64 of:
+
+        version byte
+        flags byte: 1 = public, 2 = has snoo_color
+        [snoo_color as 24 bits]
+        component count byte
+        for each component:
+            tailor id (32 bits)
+            flags byte: 1 = null, 2 = dressingName, 4 = color, 8 = altColor
+            [dressing id (32 bits)] [color (24 bits)] [altColor (24 bits)]
+
+    Tailors and dressings are stored as crc32s of their names rather than
+    positions in the catalogue so adding or reordering dressings doesn't
+    change what existing rows mean. Ids that aren't in the catalogue any
+    more decode to UNKNOWN_NAME placeholders, like "#0badf00d", which pack
+    back to the same ids, so rows survive a tailor or dressing going away
+    and coming back. Colors are normalized to lowercase #rrggbb.
+    Snoovatars that can't be represented this way, and rows written before
+    this existed, are stored and read as JSON.
+
+    """
+
+    VERSION = 1
+
+    PUBLIC = 1
+    HAS_SNOO_COLOR = 2
+
+    NULL = 1
+    HAS_DRESSING = 2
+    HAS_COLOR = 4
+    HAS_ALT_COLOR = 8
+
+    COMPONENT_KEYS = frozenset(("dressingName", "color", "altColor"))
+
+    UNKNOWN_NAME = "#%08x"
+    r_unknown_name = re.compile(r"\A#[0-9a-f]{8}\Z")
+
+    def __init__(self, tailors):
+        # name -> id and id -> (name, {dressing name -> id}, {id -> name})
+        self.tailor_ids = {}
+        self.tailors_by_id = {}
+
+        for tailor in tailors:
+            dressing_ids = {}
+            dressings_by_id = {}
+            for dressing in tailor["dressings"]:
+                dressing_id = name_id(dressing["name"])
+                if dressing_id in dressings_by_id:
+                    # a collision would be ambiguous, so neither can be
+                    # packed. snoovatars using them will be stored as json.
+                    dressing_ids.pop(dressings_by_id[dressing_id], None)
+                    continue
+                dressing_ids[dressing["name"]] = dressing_id
+                dressings_by_id[dressing_id] = dressing["name"]
+
+            tailor_id = name_id(tailor["name"])
+            if tailor_id in self.tailors_by_id:
+                colliding_name = self.tailors_by_id[tailor_id][0]
+                self.tailor_ids.pop(colliding_name, None)
+                continue
+            self.tailor_ids[tailor["name"]] = tailor_id
+            self.tailors_by_id[tailor_id] = (
+                tailor["name"], dressing_ids, dressings_by_id)
+
+    @classmethod
+    def is_packed(cls, raw):
+        return not raw.startswith("{")
+
+    def encode(self, snoovatar):
+        try:
+            return base64.b64encode(self._pack(snoovatar))
+        except ValueError:
+            return json.dumps(snoovatar)
+
+    def decode(self, raw):
+        if not self.is_packed(raw):
+            return json.loads(raw)
+        return self._unpack(base64.b64decode(raw))
+
+    def _id(self, ids, name):
+        """Look up the id of a tailor or dressing name or placeholder."""
+        if not isinstance(name, basestring):
+            return None
+        if self.r_unknown_name.match(name):
+            return int(name[1:], 16)
+        return ids.get(name)
+
+    def _pack_color(self, color):
+        if (not isinstance(color, basestring) or
+                not VSnooColor.r_hex_color.match(color)):
+            raise ValueError("can't pack color %r" % color)
+        if len(color) == 4:
+            color = "#" + "".join(c * 2 for c in color[1:])
+        return struct.pack(">I", int(color[1:], 16))[1:]
+
+    def _unpack_color(self, data, offset):
+        value, = struct.unpack(">I", "\0" + data[offset:offset + 3])
+        return "#%06x" % value, offset + 3
+
+    def _pack(self, snoovatar):
+        public = snoovatar.get("public")
+        snoo_color = snoovatar.get("snoo_color")
+        components = snoovatar.get("components")
+        if (set(snoovatar) != {"public", "snoo_color", "components"} or
+                not isinstance(public, bool) or
+                not isinstance(components, dict) or
+                len(components) > 255):
+            raise ValueError("can't pack snoovatar")
+
+        flags = self.PUBLIC if public else 0
+        if snoo_color:
+            flags |= self.HAS_SNOO_COLOR
+        elif snoo_color != "":
+            raise ValueError("can't pack snoo_color %r" % snoo_color)
+
+        parts = [struct.pack(">BB", self.VERSION, flags)]
+        if snoo_color:
+            parts.append(self._pack_color(snoo_color))
+        parts.append(struct.pack(">B", len(components)))
+
+        # components are written in id order so a snoovatar always packs the
+        # same way, whether its tailors are named or placeholders.
+        by_id = {}
+        for tailor_name, component in components.iteritems():
+            tailor_id = self._id(self.tailor_ids, tailor_name)
+            if tailor_id is None or tailor_id in by_id:
+                raise ValueError("can't pack tailor %r" % tailor_name)
+            by_id[tailor_id] = component
+
+        for tailor_id, component in sorted(by_id.iteritems()):
+            dressing_ids = self.tailors_by_id.get(tailor_id, (None, {}))[1]
+
+            if component is None:
+                parts.append(struct.pack(">IB", tailor_id, self.NULL))
+                continue
+
+            if (not isinstance(component, dict) or
+                    not self.COMPONENT_KEYS.issuperset(component)):
+                raise ValueError("can't pack component %r" % component)
+
+            flags = 0
+            fields = []
+            if "dressingName" in component:
+                dressing_id = self._id(dressing_ids, component["dressingName"])
+                if dressing_id is None:
+                    raise ValueError("can't pack dressing %r" % component)
+                flags |= self.HAS_DRESSING
+                fields.append(struct.pack(">I", dressing_id))
+            if "color" in component:
+                flags |= self.HAS_COLOR
+                fields.append(self._pack_color(component["color"]))
+            if "altColor" in component:
+                flags |= self.HAS_ALT_COLOR
+                fields.append(self._pack_color(component["altColor"]))
+
+            parts.append(struct.pack(">IB", tailor_id, flags))
+            parts.extend(fields)
+
+        return "".join(parts)
+
+    def _unpack(self, data):
+        version, flags = struct.unpack_from(">BB", data)
+        if version != self.VERSION:
+            raise ValueError("unknown snoovatar version %d" % version)
+        offset = 2
+
+        snoovatar = {
+            "public": bool(flags & self.PUBLIC),
+            "snoo_color": "",
+            "components": {},
+        }
+        if flags & self.HAS_SNOO_COLOR:
+            snoovatar["snoo_color"], offset = self._unpack_color(data, offset)
+
+        count, = struct.unpack_from(">B", data, offset)
+        offset += 1
+
+        for _ in xrange(count):
+            tailor_id, flags = struct.unpack_from(">IB", data, offset)
+            offset += 5
+
+            component = {}
+            if flags & self.HAS_DRESSING:
+                dressing_id, = struct.unpack_from(">I", data, offset)
+                offset += 4
+                component["dressingName"] = dressing_id
+            if flags & self.HAS_COLOR:
+                component["color"], offset = self._unpack_color(data, offset)
+            if flags & self.HAS_ALT_COLOR:
+                component["altColor"], offset = self._unpack_color(data, offset)
+
+            tailor = self.tailors_by_id.get(tailor_id)
+            if tailor:
+                tailor_name, dressing_ids, dressings_by_id = tailor
+            else:
+                # the tailor has since been removed from the catalogue
+                tailor_name = self.UNKNOWN_NAME % tailor_id
+                dressings_by_id = {}
+
+            if flags & self.NULL:
+                snoovatar["components"][tailor_name] = None
+                continue
+
+            if "dressingName" in component:
+                dressing_id = component["dressingName"]
+                component["dressingName"] = dressings_by_id.get(
+                    dressing_id, self.UNKNOWN_NAME % dressing_id)
+            snoovatar["components"][tailor_name] = component
+
+        return snoovatar
@@ -0,0 +1,122 @@
+import json
+import pkg_resources
+
+from r2.lib.js import DataSource
+
+from reddit_gold.snoovatar_codec import SnoovatarCodec
+from reddit_gold.validators import VSnooColor
+
+
+class TailorIndex(object):
+    """Which dressings each snoovatar tailor offers, for validating saves.
+
+    Built once from the tailor catalogue so checking a submitted snoovatar
+    is a set lookup per component rather than a scan of every dressing.
+
+    """
+
+    def __init__(self, tailors):
+        self._dressings = {
+            tailor["name"]: frozenset(d["name"] for d in tailor["dressings"])
+            for tailor in tailors
+        }
+        self._required = frozenset(
+            tailor["name"] for tailor in tailors if not tailor["allow_clear"])
+
+    def __contains__(self, tailor_name):
+        return tailor_name in self._dressings
+
+    def validate(self, components):
+        """Return the components with an entry for every tailor, or None if
+        any component is unknown, missing when required, uses a dressing
+        that doesn't exist or has a color that isn't hex."""
+        if not isinstance(components, dict):
+            return None
+
+        for tailor_name, component in components.iteritems():
+            dressings = self._dressings.get(tailor_name)
+            if dressings is None:
+                return None
+
+            if not component:
+                continue
+
+            if not isinstance(component, dict):
+                return None
+
+            dressing = component.get("dressingName")
+            if dressing and dressing not in dressings:
+                return None
+
+            for color_type in ("color", "altColor"):
+                color = component.get(color_type)
+                if color and not (isinstance(color, basestring) and
+                                  VSnooColor.r_hex_color.match(color)):
+                    return None
+
+        # if the tailor requires a selection, ensure there is one
+        for tailor_name in self._required:
+            if not components.get(tailor_name):
+                return None
+
+        return {tailor_name: components.get(tailor_name)
+                for tailor_name in self._dressings}
+
+
+class TailorCatalogue(object):
+    """The parsed contents of data/tailors.json and an index over them.
+
+    sprites lists the content-hashed sprite bundles from data/sprites.json
+    that the editor loads the artwork from.
+
+    """
+
+    def __init__(self, tailors, sprites=()):
+        self.tailors = tuple(tailors)
+        self.sprites = tuple(sprites)
+        self.index = TailorIndex(self.tailors)
+        self.codec = SnoovatarCodec(self.tailors)
+
+    @classmethod
+    def load(cls):
+        def load_data(path):
+            return json.load(pkg_resources.resource_stream(
+                "reddit_gold",
+                path,
+            ))
+
+        return cls(load_data("data/tailors.json"),
+                   load_data("data/sprites.json"))
+
+
+_catalogue = None
+
+
+def get_tailor_catalogue():
+    """Return the tailor catalogue, loading it the first time it's needed."""
+    global _catalogue
+
+    if _catalogue is None:
+        _catalogue = TailorCatalogue.load()
+    return _catalogue
+
+
+class TailorsDataSource(DataSource):
+    """A DataSource for the tailor catalogue and its sprite bundles that
+    only loads them when the JS is actually built or served.
+
+    The sprite bundle names change with their contents, so they're part of
+    the built JS rather than fetched at runtime.
+
+    """
+
+    def __init__(self, wrap):
+        self.wrap = wrap
+
+    @property
+    def data(self):
+        catalogue = get_tailor_catalogue()
+        return {
+            "tailors": catalogue.tailors,
+            "sprites": catalogue.sprites,
+        }
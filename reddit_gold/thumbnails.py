@@ -0,0 +1,188 @@
+import errno
+import os
+import subprocess
+import tempfile
+import threading
+
+from pylons import app_globals as g
+
+from reddit_gold.compositor import get_compositor, get_snoovatar_svg
+
+
+THUMBNAIL_SIZES = (32, 64, 128, 256, 400)
+DEFAULT_RASTERIZER = "rsvg-convert"
+RASTERIZE_TIMEOUT = 10
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+
+class RasterizeError(Exception):
+    pass
+
+
+def rasterize(svg, size, rasterizer=DEFAULT_RASTERIZER,
+              timeout=RASTERIZE_TIMEOUT):
+    """Render an SVG to a size x size PNG with rsvg-convert.
+
+    The rasterizer is killed if it hasn't finished after timeout seconds.
+
+    """
+
+    try:
+        process = subprocess.Popen(
+            [rasterizer, "--format=png",
+             "--width=%d" % size, "--height=%d" % size],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError as e:
+        raise RasterizeError("can't run %s: %s" % (rasterizer, e))
+
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        try:
+            process.kill()
+        except OSError:
+            # it exited just in time
+            pass
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        png, error = process.communicate(svg)
+    finally:
+        timer.cancel()
+
+    if timed_out.is_set():
+        raise RasterizeError("%s took longer than %ss" % (rasterizer, timeout))
+    if process.returncode != 0:
+        raise RasterizeError(error.strip())
+    return png
+
+
+class ThumbnailCache(object):
+    """A size-bounded directory of PNGs, evicted least recently used first.
+
+    Files are touched when they're read, so their mtime is when they were
+    last used. Nothing is evicted when reading or writing, since that means
+    scanning the whole directory; evict() is run periodically instead by
+    scripts/evict_snoovatar_thumbnails.py and trims the cache down to
+    LOW_WATER of max_bytes when it's over.
+
+    """
+
+    LOW_WATER = .9
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + ".png")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            # evicted by another process since we read it
+            pass
+        return data
+
+    def set(self, key, data):
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+
+    def _entries(self):
+        for directory, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith(".png"):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def evict(self):
+        """Delete the least recently used files if the cache is too big.
+
+        Returns how many bytes the cache holds afterwards.
+
+        """
+
+        entries = sorted(self._entries())
+        total = sum(size for mtime, size, path in entries)
+
+        if total > self.max_bytes:
+            target = self.max_bytes * self.LOW_WATER
+            for mtime, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                total -= size
+
+        return total
+
+
+_thumbnail_cache = None
+
+
+def get_thumbnail_cache():
+    global _thumbnail_cache
+
+    if _thumbnail_cache is None:
+        root = (g.snoovatar_thumbnail_dir or
+                os.path.join(tempfile.gettempdir(), "snoovatar-thumbnails"))
+        max_bytes = g.snoovatar_thumbnail_cache_size or DEFAULT_CACHE_SIZE
+        _thumbnail_cache = ThumbnailCache(root, max_bytes)
+    return _thumbnail_cache
+
+
+def get_snoovatar_png(snoovatar, size):
+    """Return (digest, png) for a snoovatar, rendering it if necessary.
+
+    Thumbnails are keyed by the composed SVG's digest, so a saved change
+    just means the next request renders a new one and the old ones age out
+    of the cache.
+
+    """
+
+    digest = get_compositor().digest(snoovatar)
+    key = "%s-%d" % (digest, size)
+
+    cache = get_thumbnail_cache()
+    png = cache.get(key)
+    if png is None:
+        g.stats.simple_event("snoovatar.png.cache.miss")
+        digest, svg = get_snoovatar_svg(snoovatar)
+        png = rasterize(svg, size, g.snoovatar_rasterizer or DEFAULT_RASTERIZER)
+        cache.set(key, png)
+    else:
+        g.stats.simple_event("snoovatar.png.cache.hit")
+    return digest, png
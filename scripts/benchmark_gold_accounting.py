@@ -0,0 +1,128 @@
+"""Benchmarks for the gold accounting job in scripts/gold_accounting.py.
+
+benchmark_classification(rows) times classifying a synthetic stream of
+transactions with and without the per-row classification cache.
+benchmark_transaction_reader(url) compares reading reddit_gold through the
+ORM with read_transactions. Both need the app configured, so run them with:
+
+    paster run $REDDIT_INI scripts/benchmark_gold_accounting.py \
+        -c "benchmark_classification()"
+
+"""
+
+import imp
+import inspect
+import os
+import random
+import time
+
+from datetime import datetime, timedelta
+from itertools import cycle, islice
+
+import psycopg2
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.expression import func, select
+
+
+# scripts/ isn't a package, so load the job from next to this file. paster
+# run doesn't set __file__.
+gold_accounting = imp.load_source("gold_accounting", os.path.join(
+    os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))),
+    "gold_accounting.py",
+))
+GoldTransaction = gold_accounting.GoldTransaction
+TRANSACTION_COLUMNS = gold_accounting.TRANSACTION_COLUMNS
+TransactionRow = gold_accounting.TransactionRow
+read_transactions = gold_accounting.read_transactions
+
+
+def synthetic_transactions(count):
+    random.seed(0)
+    first_date = datetime(2014, 1, 1, tzinfo=psycopg2.tz.FixedOffsetTimezone(offset=-420, name=None))
+    return [dict(
+        trans_id=random.choice(['g', 'P', 'RG', 'Sch_', 'C', 'M']) + str(i),
+        status=random.choice(['processed', 'gift', 'instagift', 'claimed']),
+        date=first_date + timedelta(minutes=i),
+        paying_id=str(random.randint(1, 1000)),
+        pennies=random.choice([0, 399, 2999, 3999]),
+        secret=random.choice(['onetime-', 'creddits-', 'gift-', 'p_', 'cr_', '']) + str(i),
+        account_id=str(random.randint(1, 1000)),
+        days=random.choice([31, 366, 31 * 3]),
+        subscr_id=None,
+    ) for i in xrange(count)]
+
+
+def benchmark_classification(rows=1000000):
+    """Time classifying a synthetic stream of rows the way the report reads
+    them, with and without the per-row classification cache."""
+    templates = synthetic_transactions(1000)
+
+    def stream():
+        for kwargs in islice(cycle(templates), rows):
+            yield TransactionRow([kwargs[c] for c in TRANSACTION_COLUMNS])
+
+    attrs = ('is_split', 'type', 'type', 'description', 'payer', 'processor')
+
+    def cached(trans):
+        for attr in attrs:
+            getattr(trans, attr)
+
+    def uncached(trans):
+        for attr in attrs:
+            try:
+                del trans._classification
+            except AttributeError:
+                pass
+            getattr(trans, attr)
+
+    def timed(fn):
+        start = time.time()
+        for trans in stream():
+            fn(trans)
+        return time.time() - start
+
+    baseline = timed(lambda trans: None)
+    for label, fn in (('uncached', uncached), ('cached', cached)):
+        elapsed = timed(fn) - baseline
+        print "%-10s %8.2fs %10.0f rows/s" % (label, elapsed, rows / elapsed)
+
+
+def benchmark_transaction_reader(url='sqlite://', rows=100000,
+                                 fetch_size=1000):
+    """Compare reading reddit_gold through the ORM with read_transactions.
+
+    url is the database to read from. If its reddit_gold table is missing or
+    empty it's created and filled with synthetic rows first, so point this
+    at a scratch database.
+
+    """
+
+    engine = create_engine(url)
+    table = GoldTransaction.__table__
+    table.create(engine, checkfirst=True)
+    if not engine.execute(select([func.count()]).select_from(table)).scalar():
+        templates = synthetic_transactions(rows)
+        for start in xrange(0, rows, fetch_size):
+            engine.execute(table.insert(), templates[start:start + fetch_size])
+
+    orm_session = sessionmaker(bind=engine)()
+
+    def orm():
+        query = orm_session.query(GoldTransaction)
+        query = query.order_by(GoldTransaction.date, GoldTransaction.trans_id)
+        return query.yield_per(fetch_size)
+
+    def lightweight():
+        return read_transactions(fetch_size=fetch_size, bind=engine)
+
+    for label, reader in (('orm', orm), ('read_transactions', lightweight)):
+        start = time.time()
+        count = 0
+        for trans in reader():
+            trans.trans_id, trans.date, trans.pennies
+            count += 1
+        elapsed = time.time() - start
+        print "%-18s %8d rows %8.2fs %10.0f rows/s" % (
+            label, count, elapsed, count / elapsed)
@@ -0,0 +1,47 @@
+"""Compare GoldHostnameFile against reading the hostname file every request.
+
+usage: python scripts/benchmark_gold_hostname.py [iterations]
+
+"""
+
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+from reddit_gold.hostname import GoldHostnameFile
+
+
+def read_every_time(path):
+    try:
+        with open(path) as f:
+            return json.loads(f.read().strip())
+    except (IOError, ValueError):
+        return ""
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({"name": "hostname", "permalink": "/r/goldservers"}, f)
+
+        cached = GoldHostnameFile(path)
+        assert cached.get() == read_every_time(path)
+
+        for label, fn in (
+            ("open/read/parse", lambda: read_every_time(path)),
+            ("GoldHostnameFile", cached.get),
+        ):
+            elapsed = timeit.timeit(fn, number=iterations)
+            print "%-18s %8.2f us/request" % (
+                label, elapsed / iterations * 1e6)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
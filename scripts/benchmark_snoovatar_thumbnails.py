@@ -0,0 +1,108 @@
+"""Measure snoovatar thumbnail rendering and the disk cache's hit ratio.
+
+Renders a synthetic population of random snoovatars at every thumbnail size,
+then replays a skewed stream of requests for them through a ThumbnailCache
+that only has room for some of the results. The cache is evicted every
+EVICT_INTERVAL requests, standing in for the periodic eviction job.
+
+usage: python scripts/benchmark_snoovatar_thumbnails.py [population] [requests] [cache MB]
+
+"""
+
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from reddit_gold.compositor import SnoovatarCompositor
+from reddit_gold.thumbnails import rasterize, ThumbnailCache, THUMBNAIL_SIZES
+
+
+EVICT_INTERVAL = 100
+
+
+def synthetic_population(compositor, count):
+    population = []
+    for _ in xrange(count):
+        components = {}
+        for name, tailor in compositor.tailors.iteritems():
+            if tailor["allow_clear"] and random.random() < .3:
+                components[name] = None
+                continue
+            components[name] = {
+                "dressingName": random.choice(tailor["dressings"])["name"],
+                "color": "#%06x" % random.getrandbits(24),
+            }
+        population.append({
+            "public": True,
+            "snoo_color": "#%06x" % random.getrandbits(24),
+            "components": components,
+        })
+    return population
+
+
+def render(compositor, cache, snoovatar, size):
+    key = "%s-%d" % (compositor.digest(snoovatar), size)
+    png = cache.get(key)
+    if png is not None:
+        return True
+
+    png = rasterize(compositor.compose(snoovatar), size)
+    cache.set(key, png)
+    return False
+
+
+def main():
+    population_size = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    request_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    cache_mb = float(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    random.seed(0)
+    compositor = SnoovatarCompositor.load()
+    population = synthetic_population(compositor, population_size)
+
+    root = tempfile.mkdtemp(prefix="snoovatar-thumbnails-")
+    try:
+        # every render misses an unbounded cache
+        cache = ThumbnailCache(root, max_bytes=float("inf"))
+        start = time.time()
+        for snoovatar in population:
+            for size in THUMBNAIL_SIZES:
+                render(compositor, cache, snoovatar, size)
+        elapsed = time.time() - start
+        size = cache.evict()
+        renders = len(population) * len(THUMBNAIL_SIZES)
+        print "cold:   %d renders in %.1fs, %.1f renders/sec, %.1f MB" % (
+            renders, elapsed, renders / elapsed, size / 1048576.)
+        shutil.rmtree(root)
+
+        # a few popular snoovatars get most of the requests
+        cache = ThumbnailCache(root, max_bytes=cache_mb * 1048576)
+        weights = [1. / (rank + 1) for rank in xrange(population_size)]
+        total_weight = sum(weights)
+        requests = []
+        for _ in xrange(request_count):
+            target = random.random() * total_weight
+            for snoovatar, weight in zip(population, weights):
+                target -= weight
+                if target <= 0:
+                    break
+            requests.append((snoovatar, random.choice(THUMBNAIL_SIZES)))
+
+        hits = 0
+        start = time.time()
+        for i, (snoovatar, size) in enumerate(requests):
+            hits += render(compositor, cache, snoovatar, size)
+            if i % EVICT_INTERVAL == EVICT_INTERVAL - 1:
+                cache.evict()
+        elapsed = time.time() - start
+        print "mixed:  %d requests in %.1fs, %.1f requests/sec, %.1f%% hits" % (
+            request_count, elapsed, request_count / elapsed,
+            100. * hits / request_count)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compare TailorIndex validation with scanning every tailor's dressings.
+
+usage: python scripts/benchmark_snoovatar_validation.py [dressings per tailor]
+
+"""
+
+import random
+import sys
+import timeit
+
+from reddit_gold.tailors import TailorIndex
+
+
+def scan_validate(tailors, components):
+    # how POST_snoovatar used to validate
+    validated = {}
+    for tailor in tailors:
+        tailor_name = tailor["name"]
+        component = components.get(tailor_name)
+        if not tailor["allow_clear"] and not component:
+            return None
+
+        dressing = component.get("dressingName")
+        if dressing:
+            for d in tailor["dressings"]:
+                if dressing == d["name"]:
+                    break
+            else:
+                return None
+
+        validated[tailor_name] = component
+    return validated
+
+
+def synthetic_catalogue(tailor_count, dressing_count):
+    return [{
+        "name": "tailor-%d" % i,
+        "allow_clear": i % 2 == 0,
+        "dressings": [{"name": "dressing-%d-%d" % (i, j)}
+                      for j in xrange(dressing_count)],
+    } for i in xrange(tailor_count)]
+
+
+def main():
+    dressing_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tailors = synthetic_catalogue(12, dressing_count)
+    index = TailorIndex(tailors)
+
+    random.seed(0)
+    snoovatars = [{
+        tailor["name"]: {"dressingName": random.choice(tailor["dressings"])["name"]}
+        for tailor in tailors
+    } for _ in xrange(100)]
+    for snoovatar in snoovatars:
+        assert index.validate(snoovatar) == scan_validate(tailors, snoovatar)
+
+    for label, fn in (
+        ("scan", lambda: [scan_validate(tailors, s) for s in snoovatars]),
+        ("TailorIndex", lambda: [index.validate(s) for s in snoovatars]),
+    ):
+        elapsed = min(timeit.repeat(fn, number=10, repeat=3))
+        print "%-12s %10.1f us/validation" % (
+            label, elapsed / (10 * len(snoovatars)) * 1e6)
+
+
+if __name__ == "__main__":
+    main()
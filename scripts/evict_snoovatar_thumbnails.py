@@ -0,0 +1,15 @@
+"""Trim the snoovatar thumbnail cache down to its size limit.
+
+Run periodically on every app server:
+
+    paster run $REDDIT_INI scripts/evict_snoovatar_thumbnails.py -c "main()"
+
+"""
+
+from reddit_gold.thumbnails import get_thumbnail_cache
+
+
+def main():
+    cache = get_thumbnail_cache()
+    size = cache.evict()
+    print "%s holds %.1f MB" % (cache.root, size / 1048576.)
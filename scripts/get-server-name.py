@@ -2,7 +2,9 @@ import ConfigParser
 import logging
 import os
 import platform
+import random
 import sys
+import threading
 import time
 
 import kazoo.exceptions
@@ -10,6 +12,7 @@ import kazoo.exceptions
 from kazoo.protocol.states import KazooState
 from kazoo.recipe.lock import Lock, Semaphore
 
+from r2.lib.stats import Stats
 from r2.lib.zookeeper import connect_to_zookeeper
 
 
@@ -20,6 +23,13 @@ logging.basicConfig()
 ROOT = "/gold/server-names"
 LOCK = "/gold/server-names-semaphore"
 
+# how long to wait on the slots' holders before looking again anyway, in
+# case a notification is missed.
+SLOT_WAIT_TIMEOUT = 300
+
+# the most, in seconds, to wait before retrying after a slot frees up.
+SLOT_RETRY_JITTER = 2
+
 
 def state_listener(state):
     # just bail if we've lost our session; upstart will revive us.
@@ -33,7 +43,57 @@ def bail_if_slots_change(children):
     os._exit(0)
 
 
-def acquire_name(client, hostname_path):
+def try_lock_any_slot(client, hostname):
+    for slot in client.get_children(ROOT):
+        slot_path = os.path.join(ROOT, slot)
+        slot_lock = Lock(client, slot_path, hostname)
+        if slot_lock.acquire(blocking=False):
+            return slot_path, slot_lock
+    return None, None
+
+
+def lock_holder(client, slot_path):
+    """Return the path of the node holding a slot's lock, or None."""
+    contenders = client.get_children(slot_path)
+    if not contenders:
+        return None
+
+    # lock nodes are sequential, so whoever has the lowest sequence number
+    # holds the lock.
+    holder = min(contenders, key=lambda node: node[-10:])
+    return os.path.join(slot_path, holder)
+
+
+def wait_for_free_slot(client):
+    """Block until one of the slots' lock holders might have let go.
+
+    Only the holders' nodes are watched. Other hosts failing to take a lock
+    create and delete contender nodes next to them, and waking up for those
+    would just have the waiting hosts retrying against each other.
+
+    """
+
+    released = threading.Event()
+
+    def on_change(event):
+        released.set()
+
+    for slot in client.get_children(ROOT):
+        holder = lock_holder(client, os.path.join(ROOT, slot))
+        if not holder or not client.exists(holder, watch=on_change):
+            # someone let go between our attempt and setting up the watch
+            break
+    else:
+        released.wait(SLOT_WAIT_TIMEOUT)
+
+    # hosts woken by the same release shouldn't all retry at once.
+    time.sleep(random.uniform(0, SLOT_RETRY_JITTER))
+
+
+def acquire_name(client, hostname_path, stats):
+    start = time.time()
+    timer = stats.get_timer("gold.server_name")
+    timer.start()
     name_slots = client.get_children(ROOT, watch=bail_if_slots_change)
     hostname = platform.node()
 
@@ -59,33 +119,38 @@ def acquire_name(client, hostname_path):
     try:
         # OK, we're one of the chosen servers. let's find a name that no one is
         # using.
-        print "name semaphore acquired. finding name."
+        print "name semaphore acquired after %.3fs. finding name." % (
+            time.time() - start)
+        timer.intermediate("semaphore")
         while True:
-            name_slots = client.get_children(ROOT)
-
-            for slot in name_slots:
-                slot_path = os.path.join(ROOT, slot)
-                slot_lock = Lock(client, slot_path, hostname)
-                if slot_lock.acquire(blocking=False):
-                    @client.DataWatch(slot_path)
-                    def on_name_change(data, stat):
-                        print "got name data %r." % data
-                        with open(hostname_path, "w") as hostname_file:
-                            print >> hostname_file, data
-
-                    # just sit around doing nothing for ever
-                    try:
-                        while True:
-                            time.sleep(1)
-                    finally:
-                        # explicitly releasing the lock decreases delay until
-                        # someone else can get this slot.
-                        slot_lock.release()
-            else:
-                # failed to lock anything. likely waiting for a session to
-                # expire. just pause for a little while.
-                print "failed to find a name. will try again."
-                time.sleep(1)
+            slot_path, slot_lock = try_lock_any_slot(client, hostname)
+            if slot_lock:
+                break
+
+            # failed to lock anything. likely waiting for a session to
+            # expire. wait for one of the slots' locks to change hands.
+            print "failed to find a name. waiting for a slot to free up."
+            wait_for_free_slot(client)
+
+        print "slot %s acquired after %.3fs." % (slot_path, time.time() - start)
+        timer.intermediate("slot")
+        timer.stop()
+
+        @client.DataWatch(slot_path)
+        def on_name_change(data, stat):
+            print "got name data %r." % data
+            with open(hostname_path, "w") as hostname_file:
+                print >> hostname_file, data
+
+        # just sit around doing nothing for ever. losing our session or the
+        # slots changing will end the process.
+        try:
+            while True:
+                time.sleep(3600)
+        finally:
+            # explicitly releasing the lock decreases delay until
+            # someone else can get this slot.
+            slot_lock.release()
     finally:
         semaphore.release()
 
@@ -100,6 +165,14 @@ def main():
     zk_username = parser.get("DEFAULT", "zookeeper_username")
     zk_password = parser.get("DEFAULT", "zookeeper_password")
 
+    statsd_addr = None
+    statsd_sample_rate = 1.0
+    if parser.has_option("DEFAULT", "statsd_addr"):
+        statsd_addr = parser.get("DEFAULT", "statsd_addr")
+    if parser.has_option("DEFAULT", "statsd_sample_rate"):
+        statsd_sample_rate = parser.getfloat("DEFAULT", "statsd_sample_rate")
+    stats = Stats(statsd_addr, statsd_sample_rate)
+
     client = connect_to_zookeeper(zk_connection_string,
                                   (zk_username, zk_password))
     client.add_listener(state_listener)
@@ -109,7 +182,7 @@ def main():
     client.ensure_path(LOCK, acl=acl)
 
     try:
-        acquire_name(client, hostname_path)
+        acquire_name(client, hostname_path, stats)
     finally:
         try:
             os.unlink(hostname_path)
@@ -1,34 +1,184 @@
+"""Monthly gold accounting report.
+
+Run from the upstart job as:
+
+    paster run $REDDIT_INI gold_accounting.py -c "run_for_prev_month()"
+
+If gold_accounting_snapshot_dir is configured, the creddit ledger at the start
+of each month is saved there so later runs only need to replay one month of
+transactions. verify_creddit_snapshot("YYYY-MM-DD") checks a saved snapshot
+against a replay of the full history.
+
+Reports for other date ranges can be built with:
+
+    paster run $REDDIT_INI gold_accounting.py \
+        -c "run('2015-01-01', '2015-04-01', format='csv', output_dir='/tmp')"
+
+and backfill() writes a separate report for each month of a range in parallel.
+
+"""
+
 from collections import deque, defaultdict
 from datetime import datetime
-import StringIO, csv, psycopg2
+import csv, errno, gzip, marshal, multiprocessing, os, psycopg2, tempfile
 
 from pylons import app_globals as g
 from r2.lib import emailer
-from r2.models.gold import Base, Session
+from r2.models.gold import Base, ENGINE
 from sqlalchemy import create_engine
 from sqlalchemy import Column, String, DateTime, Integer
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.expression import select
 from sqlalchemy.ext.declarative import declarative_base
 
 
-session = Session()
+class PrefixTable(object):
+    """Maps string prefixes to values, bucketed by first character."""
+
+    def __init__(self, prefixes):
+        self.buckets = defaultdict(list)
+        for prefix, value in sorted(prefixes, key=lambda p: -len(p[0])):
+            self.buckets[prefix[0]].append((prefix, value))
+
+    def match(self, s, default=None):
+        for prefix, value in self.buckets.get(s[:1], ()):
+            if s.startswith(prefix):
+                return value
+        return default
+
+
+# none of these are prefixes of each other so at most one can match
+SECRET_KINDS = PrefixTable([
+    ('o_', 'charter'),
+    ('autorenew-', 'autorenew'),
+    ('creddits-', 'creddits'),
+    ('{creddits,', 'creddits'),
+    ('cr_', 'creddits'),
+    ('{gift,', 'gift'),
+    ('gift-', 'gift'),
+    ('onetime-', 'onetime'),
+    ('{onetime,', 'onetime'),
+    ('p_', 'postcard'),
+    ('c_', 'postcard'),
+    ('el_', 'extralife'),
+    ('e_', 'extralife'),
+])
+
+PROCESSORS = PrefixTable([
+    ('g', 'Google Payments'),
+    ('P', 'Paypal'),
+    ('RG', 'redditgifts (Balanced)'),
+    ('Sch_', 'Stripe'),
+    ('C', 'Coinbase'),
+])
+
+
+class TransactionClass(object):
+    """What kind of transaction a row is, worked out once per row."""
+
+    __slots__ = ('type', 'processor', 'is_split')
+
+    def __init__(self, type, processor, is_split):
+        self.type = type
+        self.processor = processor
+        self.is_split = is_split
+
+
+def _transaction_type(trans, secret, secret_kind):
+    # Statuses to check for first
+    if trans.status == 'expired-promo':
+        return 'expired-promo'
+    if trans.paying_id == 'bundle':
+        return 'appsumo-bundle'
+
+    # Charter member payments
+    if trans.date <= TransactionMixin._charter_end or secret_kind == 'charter':
+        return 'charter'
+
+    # RG Elves
+    if trans.trans_id.startswith('RG'):
+        if trans.pennies % 399 != 0 and trans.pennies % 2999 != 0:
+            return 'rg-elves'
+
+    # Subscriptions
+    if trans.subscr_id:
+        if secret_kind == 'autorenew':
+            # no easy way to tell if a Stripe subscription is new or automatic
+            if trans.subscr_id.startswith('cus_'):
+                return 'subscription'
+            else:
+                return 'subscription-new'
+        else:
+            return 'subscription-auto'
+
+    # Gift code purchases
+    if trans.status in ('claimed', 'unclaimed') and len(secret) == 10:
+        return 'giftcode'
+
+    # Creddit purchases
+    if secret_kind == 'creddits':
+        # some old strange transactions have 0 days
+        # looks like people experimenting with sending custom amounts
+        if trans.days != 0:
+            return 'creddits'
+
+    # Gifts and Gildings
+    if trans.status == 'gift':
+        if trans.trans_id.endswith('-A'):
+            trans_type = 'gilding'
+        else:
+            trans_type = 'gift'
 
-class GoldTransaction(Base):
-    __tablename__ = 'reddit_gold'
+        if trans.pennies == 0:
+            trans_type += '-creddit'
 
-    _charter_end = datetime(2010, 7, 20, 8, 6, 10, 365317, tzinfo=psycopg2.tz.FixedOffsetTimezone(offset=-420, name=None))
+        return trans_type
 
-    # database columns
-    trans_id = Column(String, primary_key=True)
-    status = Column(String)
-    date = Column(DateTime)
-    payer_email = Column(String)
-    paying_id = Column(String)
-    pennies = Column(Integer)
-    secret = Column(String)
-    account_id = Column(String)
-    days = Column(Integer)
-    subscr_id = Column(String)
+    if trans.status == 'instagift':
+        return 'gilding'
+
+    if secret_kind == 'gift':
+        return 'gift'
+
+    # One-time purchases
+    if secret_kind == 'onetime' or not secret:
+        return 'onetime-self'
+
+    # Manual grants via codes
+    if trans.trans_id.startswith('M'):
+        if secret_kind in ('postcard', 'extralife'):
+            return secret_kind
+
+        return 'other-manual'
+
+    return 'unknown'
+
+
+def classify_transaction(trans):
+    """Classify a row, ignoring any overrides from the other half of a split
+    transaction."""
+    secret = trans.secret or ''
+    trans_type = _transaction_type(trans, secret, SECRET_KINDS.match(secret))
+    is_split = (trans_type in ('gilding', 'gift') or
+                (trans_type == 'rg-elves' and secret.startswith('gift-')))
+    return TransactionClass(
+        type=trans_type,
+        processor=PROCESSORS.match(trans.trans_id, 'Unknown'),
+        is_split=is_split,
+    )
+
+
+class TransactionMixin(object):
+    """What the report needs to know about a reddit_gold row, worked out
+    from its columns.
+
+    Shared by the GoldTransaction model and the lighter TransactionRow.
+
+    """
+
+    __slots__ = ()
+
+    _charter_end = datetime(2010, 7, 20, 8, 6, 10, 365317, tzinfo=psycopg2.tz.FixedOffsetTimezone(offset=-420, name=None))
 
     DESCRIPTIONS = {
         "onetime-self": "One-time subscription purchase for self",
@@ -46,8 +196,6 @@ class GoldTransaction(Base):
         "unknown": "Unknown",
     }
 
-    overrides = {}
-
     @property
     def transaction_id(self):
         if 'trans_id' in self.overrides:
@@ -55,93 +203,27 @@ class GoldTransaction(Base):
         
         return self.trans_id
 
+    @property
+    def classification(self):
+        try:
+            return self._classification
+        except AttributeError:
+            self._classification = classify_transaction(self)
+            return self._classification
+
     @property
     def type(self):
         if 'type' in self.overrides:
             return self.overrides['type']
 
-        secret = self.secret or ''
-
-        # Statuses to check for first
-        if self.status == 'expired-promo':
-            return 'expired-promo'
-        if self.paying_id == 'bundle':
-            return 'appsumo-bundle'
-
-        # Charter member payments
-        if self.date <= self._charter_end or secret.startswith('o_'):
-            return 'charter'
-
-        # RG Elves
-        if self.trans_id.startswith('RG'):
-            if self.revenue % 399 != 0 and self.revenue % 2999 != 0:
-                return 'rg-elves'
-        
-        # Subscriptions
-        if self.subscr_id:
-            if secret.startswith('autorenew-'):
-                # no easy way to tell if a Stripe subscription is new or automatic
-                if self.subscr_id.startswith('cus_'):
-                    return 'subscription'
-                else:
-                    return 'subscription-new'
-            else:
-                return 'subscription-auto'
-
-        # Gift code purchases
-        if self.status in ('claimed', 'unclaimed') and len(secret) == 10:
-            return 'giftcode'
-
-        # Creddit purchases
-        if secret.startswith(('creddits-', '{creddits,', 'cr_')):
-            # some old strange transactions have 0 days
-            # looks like people experimenting with sending custom amounts
-            if self.days != 0:
-                return 'creddits'
-
-        # Gifts and Gildings
-        if self.status == 'gift':
-            if self.trans_id.endswith('-A'):
-                trans_type = 'gilding'
-            else:
-                trans_type = 'gift'
-
-            if self.revenue == 0:
-                trans_type += '-creddit'
-
-            return trans_type
-
-        if self.status == 'instagift':
-            return 'gilding'
-
-        if secret.startswith(('{gift,', 'gift-')):
-            return 'gift'
-
-        # One-time purchases
-        if secret.startswith(('onetime-', '{onetime,')) or not secret:
-            return 'onetime-self'
-
-        # Manual grants via codes
-        if self.trans_id.startswith('M'):
-            if secret.startswith(('p_', 'c_')):
-                return 'postcard'
-            elif secret.startswith(('el_', 'e_')):
-                return 'extralife'
-
-            return 'other-manual'
-
-        return 'unknown'
-        
+        return self.classification.type
 
     @property
     def description(self):
         if 'description' in self.overrides:
             return self.overrides['description']
 
-        if self.type in self.DESCRIPTIONS:
-            return self.DESCRIPTIONS[self.type]
-
-        return self.type
+        return self.DESCRIPTIONS.get(self.type, self.type)
 
     @property
     def payer(self):
@@ -153,11 +235,7 @@ class GoldTransaction(Base):
     # used for the trans types that cover 2 rows in the db
     @property
     def is_split(self):
-        if self.type in ('gilding', 'gift'):
-            return True
-        if self.type == 'rg-elves' and self.secret.startswith("gift-"):
-            return True
-        return False
+        return self.classification.is_split
 
     @property
     def is_reversed(self):
@@ -173,18 +251,7 @@ class GoldTransaction(Base):
         if 'processor' in self.overrides:
             return self.overrides['processor']
 
-        if self.trans_id.startswith('g'):
-            return 'Google Payments'
-        elif self.trans_id.startswith('P'):
-            return 'Paypal'
-        elif self.trans_id.startswith('RG'):
-            return 'redditgifts (Balanced)'
-        elif self.trans_id.startswith('Sch_'):
-            return 'Stripe'
-        elif self.trans_id.startswith('C'):
-            return 'Coinbase'
-        
-        return 'Unknown'
+        return self.classification.processor
 
     @property
     def revenue(self):
@@ -202,19 +269,31 @@ class GoldTransaction(Base):
         else:
             raise ValueError
 
-    @classmethod
-    def get_transactions(cls, start_date=None, end_date=None):
-        query = session.query(cls)
-        if start_date:
-            query = query.filter(cls.date >= start_date)
-        if end_date:
-            query = query.filter(cls.date < end_date)
 
-        query = query.order_by(cls.date, cls.trans_id)
-        query = query.yield_per(1000)   # retrieve 1000 rows at a time
+class GoldTransaction(TransactionMixin, Base):
+    __tablename__ = 'reddit_gold'
+
+    # database columns
+    trans_id = Column(String, primary_key=True)
+    status = Column(String)
+    date = Column(DateTime)
+    payer_email = Column(String)
+    paying_id = Column(String)
+    pennies = Column(Integer)
+    secret = Column(String)
+    account_id = Column(String)
+    days = Column(Integer)
+    subscr_id = Column(String)
+
+    overrides = {}
+
+    @classmethod
+    def get_transactions(cls, start_date=None, end_date=None, fetch_size=1000,
+                         bind=None):
+        transactions = read_transactions(start_date, end_date, fetch_size, bind)
 
         overrides = {}
-        for trans in query:
+        for trans in transactions:
             if overrides or not trans.is_split:
                 trans.overrides = overrides
                 overrides = {}
@@ -228,44 +307,250 @@ class GoldTransaction(Base):
                 overrides['is_reversed'] = trans.is_reversed
 
 
-class Creddit(object):
-    def __init__(self, value, processor, purchase_time):
-        self.value = value
-        self.processor = processor
-        self.purchase_time = purchase_time
-        if self.purchase_time < datetime(2013, 1, 1, tzinfo=psycopg2.tz.FixedOffsetTimezone(offset=-420, name=None)):
-            self.value = 0
+# the columns the report reads, in the order TransactionRow takes them
+TRANSACTION_COLUMNS = (
+    'trans_id',
+    'status',
+    'date',
+    'paying_id',
+    'pennies',
+    'secret',
+    'account_id',
+    'days',
+    'subscr_id',
+)
 
 
-def get_creddit_balances_on(date):
-    user_creddits = defaultdict(deque)
-    transactions = GoldTransaction.get_transactions(end_date=date)
+class TransactionRow(TransactionMixin):
+    """A read-only reddit_gold row without any ORM bookkeeping."""
+
+    __slots__ = TRANSACTION_COLUMNS + ('overrides', '_classification')
+
+    def __init__(self, row):
+        (self.trans_id, self.status, self.date, self.paying_id, self.pennies,
+         self.secret, self.account_id, self.days, self.subscr_id) = row
+        self.overrides = {}
+
+
+def read_transactions(start_date=None, end_date=None, fetch_size=1000,
+                      bind=None):
+    """Yield TransactionRows ordered by date.
+
+    Only the columns in TRANSACTION_COLUMNS are selected and the results are
+    streamed through a server-side cursor fetch_size rows at a time.
+
+    """
+
+    table = GoldTransaction.__table__
+    query = select([table.c[column] for column in TRANSACTION_COLUMNS])
+    if start_date:
+        query = query.where(table.c.date >= start_date)
+    if end_date:
+        query = query.where(table.c.date < end_date)
+    query = query.order_by(table.c.date, table.c.trans_id)
+
+    conn = (bind or ENGINE).connect().execution_options(stream_results=True)
+    try:
+        result = conn.execute(query)
+        while True:
+            rows = result.fetchmany(fetch_size)
+            if not rows:
+                break
+
+            for row in rows:
+                yield TransactionRow(row)
+    finally:
+        conn.close()
+
+
+class CredditQueue(object):
+    """A user's unspent creddits, oldest first.
+
+    Creddits bought together all have the same value, so they're stored as
+    [value, processor, count] runs along with a running count and total.
+
+    """
+
+    __slots__ = ("runs", "count", "total")
+
+    def __init__(self):
+        self.runs = deque()
+        self.count = 0
+        self.total = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value, processor, count):
+        if self.runs and self.runs[-1][:2] == [value, processor]:
+            self.runs[-1][2] += count
+        else:
+            self.runs.append([value, processor, count])
+        self.count += count
+        self.total += value * count
+
+    def spend(self, count):
+        """Remove up to count of the oldest creddits."""
+        while count and self.runs:
+            run = self.runs[0]
+            used = min(count, run[2])
+            run[2] -= used
+            count -= used
+            self.count -= used
+            self.total -= run[0] * used
+            if not run[2]:
+                self.runs.popleft()
+
+    def average_value(self):
+        return self.total / self.count
+
+
+def add_creddits(user_creddits, trans):
+    value = trans.revenue / trans.months
+    if trans.date < datetime(2013, 1, 1, tzinfo=psycopg2.tz.FixedOffsetTimezone(offset=-420, name=None)):
+        value = 0
+    user_creddits[trans.account_id].add(value, trans.processor, trans.months)
+
+
+def replay_creddits(user_creddits, transactions):
     for trans in transactions:
         if trans.type == 'creddits':
-            creddit = Creddit(value=trans.revenue / trans.months,
-                              processor=trans.processor,
-                              purchase_time=trans.date)
-            user_creddits[trans.account_id].extend([creddit] * trans.months)
+            add_creddits(user_creddits, trans)
         elif trans.type.endswith('-creddit'):
-            for _ in xrange(trans.months):
-                try:
-                    user_creddits[trans.payer].popleft()
-                except:
-                    break
+            user_creddits[trans.payer].spend(trans.months)
+    return user_creddits
+
+
+SNAPSHOT_DATE_FORMAT = '%Y-%m-%d'
+SNAPSHOT_FILENAME = 'creddits_{0}.marshal'
+
+
+def snapshot_path(date):
+    return os.path.join(
+        g.gold_accounting_snapshot_dir,
+        SNAPSHOT_FILENAME.format(date.strftime(SNAPSHOT_DATE_FORMAT)),
+    )
+
+
+def creddit_runs(user_creddits):
+    """Return each user's creddits as [value, processor, count] runs."""
+    return {account_id: [list(run) for run in creddits.runs]
+            for account_id, creddits in user_creddits.iteritems()
+            if creddits.runs}
+
+
+def save_creddit_snapshot(date, user_creddits):
+    """Save the creddit ledger as of the start of date."""
+    try:
+        os.makedirs(g.gold_accounting_snapshot_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    path = snapshot_path(date)
+    with open(path + '.tmp', 'wb') as f:
+        marshal.dump(creddit_runs(user_creddits), f)
+    os.rename(path + '.tmp', path)
+
+
+def load_creddit_snapshot(path):
+    with open(path, 'rb') as f:
+        return ledger_from_runs(marshal.load(f))
 
+
+def ledger_from_runs(runs):
+    user_creddits = defaultdict(CredditQueue)
+    for account_id, user_runs in runs.iteritems():
+        for value, processor, count in user_runs:
+            user_creddits[account_id].add(value, processor, count)
     return user_creddits
 
 
-def run_for_prev_month():
-    end_date = datetime(datetime.now().year, datetime.now().month, 1)
-    if end_date.month == 1:
-        start_date = datetime(end_date.year-1, 12, 1)
+def find_latest_snapshot(date):
+    """Return the date of the latest saved snapshot on or before date."""
+    if not g.gold_accounting_snapshot_dir:
+        return None
+
+    try:
+        filenames = os.listdir(g.gold_accounting_snapshot_dir)
+    except OSError as e:
+        # nothing has been saved yet
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+
+    prefix, suffix = SNAPSHOT_FILENAME.split('{0}')
+    latest = None
+    for filename in filenames:
+        if not (filename.startswith(prefix) and filename.endswith(suffix)):
+            continue
+
+        try:
+            snapshot_date = datetime.strptime(
+                filename[len(prefix):-len(suffix)], SNAPSHOT_DATE_FORMAT)
+        except ValueError:
+            continue
+
+        if snapshot_date <= date and (not latest or snapshot_date > latest):
+            latest = snapshot_date
+    return latest
+
+
+def get_creddit_balances_on(date):
+    snapshot_date = find_latest_snapshot(date)
+    if snapshot_date:
+        user_creddits = load_creddit_snapshot(snapshot_path(snapshot_date))
     else:
-        start_date = datetime(end_date.year, end_date.month-1, 1)
+        user_creddits = defaultdict(CredditQueue)
+
+    if snapshot_date != date:
+        transactions = GoldTransaction.get_transactions(
+            start_date=snapshot_date, end_date=date)
+        replay_creddits(user_creddits, transactions)
+
+        if g.gold_accounting_snapshot_dir:
+            save_creddit_snapshot(date, user_creddits)
+
+    return user_creddits
+
+
+def verify_creddit_snapshot(date):
+    """Check the saved snapshot for date against a full history replay."""
+    date = datetime.strptime(date, SNAPSHOT_DATE_FORMAT)
+    snapshot = creddit_runs(load_creddit_snapshot(snapshot_path(date)))
+    replayed = creddit_runs(replay_creddits(
+        defaultdict(CredditQueue),
+        GoldTransaction.get_transactions(end_date=date),
+    ))
+
+    mismatched = [account_id
+                  for account_id in set(snapshot) | set(replayed)
+                  if snapshot.get(account_id) != replayed.get(account_id)]
+    for account_id in mismatched:
+        print "%s: snapshot %r, replay %r" % (
+            account_id, snapshot.get(account_id), replayed.get(account_id))
+
+    print "%s: %d accounts checked, %d mismatched" % (
+        date.strftime(SNAPSHOT_DATE_FORMAT),
+        len(set(snapshot) | set(replayed)),
+        len(mismatched),
+    )
+    return not mismatched
+
+
+def write_report(output, start_date, end_date, user_creddits=None):
+    """Write the report's rows to output as they're read from the db.
+
+    user_creddits is the creddit ledger as of start_date. It's looked up if
+    not given, in which case the ledger at end_date is snapshotted too.
+    Callers passing a ledger in are expected to look after the snapshots.
+
+    """
 
-    user_creddits = get_creddit_balances_on(start_date)
+    save_snapshot = user_creddits is None
+    if user_creddits is None:
+        user_creddits = get_creddit_balances_on(start_date)
 
-    output = StringIO.StringIO()
     writer = csv.writer(output, delimiter=',', quotechar='"')
     data = [
             'Date/time',
@@ -285,10 +570,7 @@ def run_for_prev_month():
         value = trans.revenue
 
         if trans.type == 'creddits':
-            creddit = Creddit(value=trans.revenue / trans.months,
-                              processor=trans.processor,
-                              purchase_time=trans.date)
-            user_creddits[trans.account_id].extend([creddit] * trans.months)
+            add_creddits(user_creddits, trans)
             value = 0
     
         elif trans.type == 'giftcode':
@@ -296,20 +578,16 @@ def run_for_prev_month():
 
         elif trans.type.endswith('-creddit'):
             # if the user has creddits that we know how they paid for
-            num_creddits = len(user_creddits[trans.payer])
+            creddits = user_creddits[trans.payer]
+            num_creddits = len(creddits)
             if num_creddits > 0:
-                value = sum(c.value for c in user_creddits[trans.payer])
-                value = value / num_creddits
+                value = creddits.average_value()
                 # if this purchase would use more creddits than we know about
                 # make sure not to add value for non-existent creddits
                 value = value * min(num_creddits, trans.months)
 
                 # remove the used creddits
-                for _ in xrange(trans.months):
-                    try:
-                        user_creddits[trans.payer].popleft()
-                    except:
-                        break
+                creddits.spend(trans.months)
         data = [
             trans.date,
             trans.transaction_id,
@@ -324,15 +602,171 @@ def run_for_prev_month():
         ]
         writer.writerow(data)
 
-    body=("""<!doctype html><html><body>
-        <span>Attached is the requested gold accounting file for %s to %s</span>
-        </body></html>""" %
-         (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
- 
-    filename=('gold_accounting_{0}_to_{1}.csv'
+    # the ledger now holds the balances at the end of the report
+    if save_snapshot and g.gold_accounting_snapshot_dir:
+        save_creddit_snapshot(end_date, user_creddits)
+
+
+REPORT_FORMATS = ('csv', 'csv.gz')
+
+
+def run(start_date, end_date, format='csv.gz', output_dir=None,
+        user_creddits=None):
+    """Build the report for [start_date, end_date) and email it.
+
+    Dates are "YYYY-MM-DD" strings or datetimes and format is one of
+    REPORT_FORMATS. The report is spooled to disk as it's written. If
+    output_dir is given the file is kept there instead of being emailed.
+
+    """
+
+    if isinstance(start_date, basestring):
+        start_date = datetime.strptime(start_date, '%Y-%m-%d')
+    if isinstance(end_date, basestring):
+        end_date = datetime.strptime(end_date, '%Y-%m-%d')
+    if format not in REPORT_FORMATS:
+        raise ValueError("format must be one of %s" % ", ".join(REPORT_FORMATS))
+
+    filename=('gold_accounting_{0}_to_{1}.{2}'
                 .format(start_date.strftime('%Y-%m-%d'),
-                        end_date.strftime('%Y-%m-%d')))
-    send_email(body, [{"name": filename, "contents": output.getvalue()}])
+                        end_date.strftime('%Y-%m-%d'),
+                        format))
+
+    if output_dir:
+        spool = open(os.path.join(output_dir, filename), 'wb')
+    else:
+        spool = tempfile.TemporaryFile()
+
+    try:
+        if format == 'csv.gz':
+            # closing the GzipFile flushes it without closing the spool. the
+            # mtime is fixed so the same report always compresses the same.
+            output = gzip.GzipFile(filename[:-len('.gz')], 'wb',
+                                   fileobj=spool, mtime=0)
+            write_report(output, start_date, end_date, user_creddits)
+            output.close()
+        else:
+            write_report(spool, start_date, end_date, user_creddits)
+
+        if output_dir:
+            print "wrote %s" % spool.name
+            return
+
+        body=("""<!doctype html><html><body>
+            <span>Attached is the requested gold accounting file for %s to %s</span>
+            </body></html>""" %
+             (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
+
+        spool.seek(0)
+        send_email(body, [{"name": filename, "contents": spool.read()}])
+    finally:
+        spool.close()
+
+
+def run_for_prev_month(format='csv.gz', output_dir=None):
+    end_date = datetime(datetime.now().year, datetime.now().month, 1)
+    if end_date.month == 1:
+        start_date = datetime(end_date.year-1, 12, 1)
+    else:
+        start_date = datetime(end_date.year, end_date.month-1, 1)
+
+    run(start_date, end_date, format=format, output_dir=output_dir)
+
+
+def month_boundaries(start_date, end_date):
+    """Split [start_date, end_date) at the start of each month."""
+    if start_date >= end_date:
+        raise ValueError("start_date must be before end_date")
+
+    boundaries = [start_date]
+    while True:
+        last = boundaries[-1]
+        if last.month == 12:
+            next_month = datetime(last.year + 1, 1, 1)
+        else:
+            next_month = datetime(last.year, last.month + 1, 1)
+
+        if next_month >= end_date:
+            break
+        boundaries.append(next_month)
+    boundaries.append(end_date)
+    return boundaries
+
+
+def opening_ledgers(boundaries):
+    """Return the creddit ledger runs at each of boundaries but the last.
+
+    The ledgers are built in a single pass over the transactions.
+
+    """
+
+    user_creddits = get_creddit_balances_on(boundaries[0])
+    ledgers = [creddit_runs(user_creddits)]
+    for start_date, end_date in zip(boundaries, boundaries[1:-1]):
+        transactions = GoldTransaction.get_transactions(start_date, end_date)
+        replay_creddits(user_creddits, transactions)
+        ledgers.append(creddit_runs(user_creddits))
+
+        if g.gold_accounting_snapshot_dir:
+            save_creddit_snapshot(end_date, user_creddits)
+    return ledgers
+
+
+def backfill(start_date, end_date, output_dir, format='csv.gz',
+             processes=None):
+    """Write one report per month in [start_date, end_date) to output_dir.
+
+    The ledger at the start of each month is worked out up front and the
+    months are then rendered in parallel. Each file is identical to what
+    run() would write for that month.
+
+    """
+
+    if isinstance(start_date, basestring):
+        start_date = datetime.strptime(start_date, '%Y-%m-%d')
+    if isinstance(end_date, basestring):
+        end_date = datetime.strptime(end_date, '%Y-%m-%d')
+
+    boundaries = month_boundaries(start_date, end_date)
+    ledgers = opening_ledgers(boundaries)
+
+    # don't share the parent's database connections with the children
+    ENGINE.dispose()
+
+    # the children are forked with their arguments rather than being sent
+    # them, since nothing defined in a paster script can be pickled.
+    processes = processes or multiprocessing.cpu_count()
+    running = []
+    failed = []
+    months = zip(boundaries, boundaries[1:], ledgers)
+    for month_start, month_end, runs in months:
+        if len(running) >= processes:
+            _wait_for_month(running.pop(0), failed)
+
+        process = multiprocessing.Process(
+            target=run,
+            args=(month_start, month_end),
+            kwargs=dict(
+                format=format,
+                output_dir=output_dir,
+                user_creddits=ledger_from_runs(runs),
+            ),
+        )
+        process.start()
+        running.append((month_start, process))
+
+    for month in running:
+        _wait_for_month(month, failed)
+
+    if failed:
+        raise Exception("failed to write reports for %s" % ", ".join(
+            month_start.strftime('%Y-%m') for month_start in failed))
+
+
+def _wait_for_month((month_start, process), failed):
+    process.join()
+    if process.exitcode != 0:
+        failed.append(month_start)
 
 
 def send_email(body, attachments):
@@ -344,5 +778,3 @@ def send_email(body, attachments):
         attachments=attachments,
     )
 
-if g.running_as_script:
-    run_for_prev_month()
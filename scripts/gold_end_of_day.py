@@ -1,8 +1,8 @@
 import datetime
 import json
-import os
 import random
 import re
+import time
 
 from itertools import chain
 
@@ -23,12 +23,16 @@ from r2.models.comment_tree import CommentTree
 from r2.models.wiki import WikiPage
 from r2.lib.db import tdb_cassandra
 
+from reddit_gold.name_slots import NameSlots
 from reddit_gold.server_naming import gold_buyers_on
 
 
 SERVERNAME_SR = Subreddit._by_name(g.gold_servername_sr)
 SYSTEM_ACCOUNT = Account._by_name(g.system_user)
 
+# how many accounts to load at once when notifying gold buyers.
+NOTIFICATION_CHUNK_SIZE = 100
+
 
 def get_recent_name_submissions():
     link_fullnames = list(queries.get_links(SERVERNAME_SR, "new", "all"))
@@ -48,12 +52,112 @@ def get_recent_name_submissions():
         yield link
 
 
-def post_if_goal_reached(date):
-    # bail out if this day's already been submitted
-    for link in get_recent_name_submissions():
-        if link.revenue_date == date:
+class NameSubmissions(object):
+    """The naming threads seen during this run, indexed by revenue_date.
+
+    The listing is only scanned once; each phase of the job reads from and
+    adds to this instead.
+
+    """
+
+    def __init__(self, links):
+        self.links = []
+        self.by_date = {}
+        for link in links:
+            self.add(link)
+
+    @classmethod
+    def load(cls):
+        return cls(get_recent_name_submissions())
+
+    def add(self, link):
+        self.links.append(link)
+        self.by_date.setdefault(link.revenue_date, link)
+
+    def __contains__(self, date):
+        return date in self.by_date
+
+    def __iter__(self):
+        return iter(self.links)
+
+
+class TemplateError(Exception):
+    pass
+
+
+class NamingTemplates(object):
+    """The wiki templates used by this job, fetched and checked up front.
+
+    Pages holding several variants separated by ---'s are split once here so
+    the rest of the job just picks one and formats it.
+
+    """
+
+    VARIANT_SEPARATOR = "\r\n---\r\n"
+
+    # the parameters each page is formatted with, or None if it isn't.
+    PAGES = {
+        "templates/boilerplate": ("percent", "buyers"),
+        "templates/goldisms": None,
+        "templates/notification-message": ("percent", "buyers", "user", "link"),
+        "templates/selftext": ("percent", "buyers"),
+        "templates/selftext-success": ("old-name", "new-name", "goldism"),
+        "templates/success-reply": ("old-name", "new-name"),
+    }
+
+    SAMPLE_PARAMS = {
+        "buyers": 1,
+        "goldism": "",
+        "link": "",
+        "new-name": "",
+        "old-name": "",
+        "percent": 100,
+        "user": "",
+    }
+
+    def __init__(self, sr):
+        pages = WikiPage.get_multiple([(sr, name) for name in self.PAGES])
+        contents = {page.name: page._get("content") for page in pages.values()}
+
+        missing = set(self.PAGES) - set(contents)
+        if missing:
+            raise TemplateError("missing pages: %s" % ", ".join(missing))
+
+        # the first line of the notification is its subject
+        notification = contents["templates/notification-message"]
+        subject, sep, body = notification.partition("\r\n")
+        self.notification_subject = subject
+        contents["templates/notification-message"] = body
+
+        self.variants = {}
+        for name, content in contents.iteritems():
+            variants = content.split(self.VARIANT_SEPARATOR)
+            for variant in variants:
+                self._check(name, variant)
+            self.variants[name] = variants
+
+    def _check(self, name, template):
+        params = self.PAGES[name]
+        if params is None:
             return
 
+        try:
+            template % {param: self.SAMPLE_PARAMS[param] for param in params}
+        except (KeyError, ValueError, TypeError) as e:
+            raise TemplateError("bad template %s: %r" % (name, e))
+
+    def get(self, name):
+        return self.VARIANT_SEPARATOR.join(self.variants[name])
+
+    def choose(self, name):
+        return random.choice(self.variants[name])
+
+
+def post_if_goal_reached(date, submissions, templates):
+    # bail out if this day's already been submitted
+    if date in submissions:
+        return
+
     revenue = gold_revenue_multi([date]).get(date, 0)
     goal = gold_goal_on(date)
     percent = revenue / float(goal)
@@ -61,10 +165,10 @@ def post_if_goal_reached(date):
     if bucket == 0:
         return
 
-    buyer_count = len(gold_buyers_on(date))
-    template_wp = WikiPage.get(SERVERNAME_SR, "templates/selftext")
-    template = random.choice(template_wp._get("content").split("\r\n---\r\n"))
-    boilerplate = WikiPage.get(SERVERNAME_SR, "templates/boilerplate")._get("content")
+    buyer_ids = gold_buyers_on(date)
+    buyer_count = len(buyer_ids)
+    template = templates.choose("templates/selftext")
+    boilerplate = templates.get("templates/boilerplate")
     selftext_template = template + "\n\n---\n\n" + boilerplate
 
     link = Link._submit(
@@ -86,38 +190,56 @@ def post_if_goal_reached(date):
     link.revenue_bucket = bucket
     link.server_names = []
     link._commit()
+    submissions.add(link)
 
     queries.new_link(link)
     link.update_search_index()
 
-    template = WikiPage.get(SERVERNAME_SR, "templates/notification-message")._get("content")
-    subject_template, sep, body_template = template.partition("\r\n")
-    for id in gold_buyers_on(date):
-        recipient = Account._byID(id, data=True)
-        send_system_message(
-            recipient,
-            subject_template,
-            body_template % {
-                "percent": int(percent * 100),
-                "buyers": buyer_count,
-                "user": recipient.name,
-                "link": link.url,
-            },
-        )
+    subject_template = templates.notification_subject
+    body_template = templates.get("templates/notification-message")
+    send_goal_notifications(buyer_ids, subject_template, body_template, {
+        "percent": int(percent * 100),
+        "buyers": buyer_count,
+        "link": link.url,
+    })
+
+
+def get_accounts(account_ids):
+    for chunk in in_chunks(account_ids, size=NOTIFICATION_CHUNK_SIZE):
+        for account in Account._byID(chunk, data=True, return_dict=False):
+            yield account
+
 
+def send_goal_notifications(account_ids, subject, body_template, params):
+    # pylons' globals and r2's caches and connections are per-thread, so
+    # messages are sent from this thread. accounts are still loaded in
+    # chunks as we go rather than all up front.
+    total = len(account_ids)
+    sent = 0
+    start = time.time()
+    for recipient in get_accounts(account_ids):
+        body = body_template % dict(params, user=recipient.name)
+        send_system_message(recipient, subject, body)
 
-def activate_requested_names(but_not):
+        sent += 1
+        if sent % 1000 == 0 or sent == total:
+            elapsed = time.time() - start
+            print "sent %d/%d notifications (%.1f/s)" % (
+                sent, total, sent / elapsed if elapsed else 0)
+
+
+def activate_requested_names(submissions, templates, slots, but_not):
     date_to_exclude = but_not
 
-    for link in get_recent_name_submissions():
+    for link in submissions:
         if link.server_names or link.revenue_date == date_to_exclude:
             continue
 
-        activate_names_requested_in(link)
+        activate_names_requested_in(link, templates, slots)
 
 
 valid_name_re = re.compile(r"(?:^|\*)([A-Za-z0-9-]{1,25})(?:$|\*)")
-def activate_names_requested_in(link):
+def activate_names_requested_in(link, templates, slots):
     comment_tree = CommentTree.by_link(link)
     acceptable_names = []
     if comment_tree.tree:
@@ -137,7 +259,7 @@ def activate_names_requested_in(link):
 
     # we activate one name for each 100% of rev goal met
     names = acceptable_names[:link.revenue_bucket]
-    activate_names(link, names)
+    activate_names(link, names, templates, slots)
 
     activated_names = [name for comment, name in names]
     link.server_names = activated_names
@@ -146,21 +268,13 @@ def activate_names_requested_in(link):
     link._commit()
 
 
-def activate_names(link, names):
+def activate_names(link, names, templates, slots):
     for comment, name in names:
-        # find a slot to assign a name to. we'll prefer nodes that are
-        # currently empty, and failing that find the least-recently-modified
-        # node.
-        ROOT = "/gold/server-names"
-        slot_names = g.zookeeper.get_children(ROOT)
-        slots = [(slot_name, g.zookeeper.get(os.path.join(ROOT, slot_name)))
-                 for slot_name in slot_names]
-        slots.sort(key=lambda (path, (data, stat)): (bool(data), stat.mtime))
-        slot_path = os.path.join(ROOT, slots[0][0])
-
+        # assign the name to a slot. we'll prefer nodes that are currently
+        # empty, and failing that the least-recently-modified node.
         comment_data = {'name': str(name),
                         'permalink': comment.make_permalink_slow()}
-        g.zookeeper.set(slot_path, json.dumps(comment_data))
+        slot_path = slots.assign(json.dumps(comment_data))
 
         lock = g.zookeeper.Lock(slot_path)
         lock_contenders = lock.contenders()
@@ -168,8 +282,7 @@ def activate_names(link, names):
         old_name = old_name or "one of our servers"
 
         # reply to the user
-        wp = WikiPage.get(SERVERNAME_SR, "templates/success-reply")
-        template = random.choice(wp._get("content").split("\r\n---\r\n"))
+        template = templates.choose("templates/success-reply")
         comment, inbox_rel = Comment._new(
             author=SYSTEM_ACCOUNT,
             link=link,
@@ -183,10 +296,8 @@ def activate_names(link, names):
         queries.new_comment(comment, inbox_rel)
 
         # update the link's text
-        wp = WikiPage.get(SERVERNAME_SR, "templates/goldisms")
-        goldism = random.choice(wp._get("content").split("\r\n---\r\n"))
-        wp = WikiPage.get(SERVERNAME_SR, "templates/selftext-success")
-        template = wp._get("content")
+        goldism = templates.choose("templates/goldisms")
+        template = templates.get("templates/selftext-success")
         link.selftext = template % {
             "old-name": old_name,
             "new-name": name,
@@ -195,12 +306,12 @@ def activate_names(link, names):
         link._commit()
 
 
-def update_sidebar():
+def update_sidebar(submissions):
     MAX_HEADING = 6
     LOG_ENTRIES = 30
 
     links = sorted(
-        get_recent_name_submissions(),
+        submissions,
         key=lambda L: L.revenue_date,
         reverse=True,
     )[:LOG_ENTRIES]
@@ -257,12 +368,16 @@ def main():
     # calculate and store the new day's gold goal
     determine_gold_goal(now.date())
 
+    submissions = NameSubmissions.load()
+    templates = NamingTemplates(SERVERNAME_SR)
+
     # post a new thread if we met our revenue goal
     yesterday = (now - datetime.timedelta(days=1)).date()
-    post_if_goal_reached(yesterday)
+    post_if_goal_reached(yesterday, submissions, templates)
 
     # look at old (now complete) threads if any
-    activate_requested_names(but_not=yesterday)
+    slots = NameSlots(g.zookeeper)
+    activate_requested_names(submissions, templates, slots, but_not=yesterday)
 
     # wait until all our amqp / permacache changes are flushed from the
     # in-process queue.
@@ -270,7 +385,7 @@ def main():
     g.reset_caches()
 
     # update the sidebar with a list of names
-    update_sidebar()
+    update_sidebar(submissions)
 
 
 if g.running_as_script:
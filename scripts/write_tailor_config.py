@@ -1,72 +1,571 @@
+"""Build tailors.json and each tailor's svg_bundle.json from the sprites.
+
+usage: python scripts/write_tailor_config.py <sprite folder> <output path>
+    [--force] [--precision=N] [--no-optimize] [--split-critical]
+
+Each run only rebuilds the directories whose SVGs or tailor.json changed
+since the last one, according to a manifest of content hashes kept next to
+the output. --force rebuilds everything.
+
+SVGs are minified before they're bundled, with coordinates rounded to
+--precision decimal places (2 by default). --no-optimize bundles them as
+they are.
+
+Every tailor's SVGs are also combined into a single sprite bundle in the
+folder above the sprites, named by a hash of its contents, and the bundles
+are listed in sprites.json next to the output. --split-critical puts the
+default look (the first dressing of each tailor that can't be cleared) in
+a bundle of its own so the editor can draw before fetching the rest.
+
+"""
+
 import glob
+import hashlib
 import json
 import os
+import re
+from multiprocessing import Pool
+from xml.etree import cElementTree as ElementTree
+
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(output_path):
+    directory, filename = os.path.split(output_path)
+    return os.path.join(directory, ".%s.manifest" % filename)
+
+
+def load_manifest(path, options):
+    try:
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (IOError, ValueError):
+        return {}
+
+    # everything needs rebuilding if it was built differently last time
+    if (manifest.get("version") != MANIFEST_VERSION or
+            manifest.get("options") != options):
+        return {}
+    return manifest.get("directories", {})
+
+
+def write_if_changed(path, content):
+    try:
+        with open(path) as existing:
+            if existing.read() == content:
+                return False
+    except IOError:
+        pass
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as output_file:
+        output_file.write(content)
+    os.rename(tmp_path, path)
+    return True
+
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+ElementTree.register_namespace("", SVG_NS)
+ElementTree.register_namespace("xlink", XLINK_NS)
+
+# bump when optimize_svg changes so the next build redoes every tailor
+OPTIMIZER_VERSION = 1
+DEFAULT_PRECISION = 2
+
+# editor cruft that doesn't change how the svg is drawn
+DROPPED_TAGS = frozenset("{%s}%s" % (SVG_NS, tag)
+                         for tag in ("title", "desc", "metadata"))
+DROPPED_ATTRIBUTES = frozenset(("enable-background", "version"))
+
+# definitions that are only drawn when something references them
+DEFINITION_TAGS = frozenset("{%s}%s" % (SVG_NS, tag) for tag in (
+    "clipPath", "filter", "linearGradient", "marker", "mask", "pattern",
+    "radialGradient", "symbol",
+))
+TEXT_TAGS = frozenset("{%s}%s" % (SVG_NS, tag) for tag in ("text", "tspan"))
+COORDINATE_ATTRIBUTES = frozenset((
+    "cx", "cy", "height", "r", "rx", "ry", "stroke-width", "width", "x",
+    "x1", "x2", "y", "y1", "y2",
+))
+COLOR_ATTRIBUTES = frozenset(("fill", "stop-color", "stroke"))
+
+PATH_ARGUMENTS = {
+    "a": 7, "c": 6, "h": 1, "l": 2, "m": 2, "q": 4, "s": 4, "t": 2, "v": 1,
+    "z": 0,
+}
+ARC_FLAGS = (3, 4)
+
+r_path_command = re.compile(r"\s*([MmZzLlHhVvCcSsQqTtAa])")
+r_path_number = re.compile(
+    r"[\s,]*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+r_path_flag = re.compile(r"[\s,]*([01])")
+r_number = re.compile(r"\A\s*[-+]?(?:\d+\.?\d*|\.\d+)\s*\Z")
+r_long_color = re.compile(r"\A#([0-9a-fA-F])\1([0-9a-fA-F])\2([0-9a-fA-F])\3\Z")
+r_reference = re.compile(r"url\(#([^)]+)\)")
+r_css_comment = re.compile(r"/\*.*?\*/", re.S)
+r_css_space = re.compile(r"\s*([{};:,])\s*")
+
+
+def format_number(value, precision):
+    text = "%.*f" % (precision, value)
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    if text in ("-0", ""):
+        text = "0"
+    if text.startswith("0."):
+        text = text[1:]
+    elif text.startswith("-0."):
+        text = "-" + text[2:]
+    return text
+
+
+def join_numbers(numbers, flags=()):
+    """Join formatted path arguments with as few separators as still parse
+    the same. flags are the indexes of arc flags, which are always followed
+    by a separator since paper.js can't parse them run into a number."""
+    joined = ""
+    for i, number in enumerate(numbers):
+        if i and (i - 1 in flags or not (
+                number.startswith("-") or
+                (number.startswith(".") and "." in numbers[i - 1]))):
+            joined += " "
+        joined += number
+    return joined
+
+
+def parse_path(d):
+    """Return [(command, [arguments])] for a path, or None if it can't be
+    parsed. Arc flags are kept as strings."""
+    commands = []
+    position = 0
+    d = d.rstrip()
+    while position < len(d):
+        match = r_path_command.match(d, position)
+        if not match:
+            return None
+        command = match.group(1)
+        position = match.end()
+
+        count = PATH_ARGUMENTS[command.lower()]
+        arguments = []
+        while count:
+            group = []
+            for i in xrange(count):
+                if command in "Aa" and i in ARC_FLAGS:
+                    match = r_path_flag.match(d, position)
+                else:
+                    match = r_path_number.match(d, position)
+                if not match:
+                    break
+                group.append(match.group(1))
+                position = match.end()
+
+            if len(group) != count:
+                if group:
+                    return None
+                break
+            arguments.extend(group)
+
+        if count and not arguments:
+            return None
+        commands.append((command, arguments))
+    return commands
+
+
+def optimize_path(d, precision):
+    commands = parse_path(d)
+    if commands is None:
+        return d
+
+    optimized = []
+    for command, arguments in commands:
+        numbers = []
+        flags = set()
+        for i, argument in enumerate(arguments):
+            if command in "Aa" and i % 7 in ARC_FLAGS:
+                numbers.append(argument)
+                flags.add(i)
+            else:
+                numbers.append(format_number(float(argument), precision))
+        optimized.append(command + join_numbers(numbers, flags))
+    return "".join(optimized)
+
+
+def optimize_css(css):
+    css = r_css_comment.sub("", css)
+    css = r_css_space.sub(r"\1", css.strip())
+    return css.replace(";}", "}").rstrip(";")
+
+
+def references_in(root):
+    referenced = set()
+    for element in root.iter():
+        for attr, value in element.items():
+            if attr == "{%s}href" % XLINK_NS and value.startswith("#"):
+                referenced.add(value[1:])
+            else:
+                referenced.update(r_reference.findall(value))
+        if element.tag == "{%s}style" % SVG_NS and element.text:
+            referenced.update(r_reference.findall(element.text))
+    return referenced
+
+
+def remove_unreferenced_definitions(root):
+    """Remove definitions nothing uses, repeating until nothing changes
+    since a removed definition might have been the only user of another."""
+    while True:
+        referenced = references_in(root)
+        removed = False
+        for parent in list(root.iter()):
+            in_defs = parent.tag == "{%s}defs" % SVG_NS
+            for child in list(parent):
+                if ((in_defs or child.tag in DEFINITION_TAGS) and
+                        child.get("id") not in referenced):
+                    parent.remove(child)
+                    removed = True
+                elif (child.tag == "{%s}defs" % SVG_NS and
+                        not len(child)):
+                    parent.remove(child)
+                    removed = True
+        if not removed:
+            return
+
+
+def optimize_svg(source, precision=DEFAULT_PRECISION):
+    """Minify an SVG without changing what snoovatar.js does with it.
+
+    Ids holding color rules (anything with a "::") and everything else
+    snoovatar.js and the compositor look at are left alone.
+
+    """
+
+    root = ElementTree.fromstring(source)
+
+    for parent in list(root.iter()):
+        for child in list(parent):
+            namespace = child.tag[1:].split("}")[0] if "}" in child.tag else ""
+            if child.tag in DROPPED_TAGS or namespace != SVG_NS:
+                parent.remove(child)
+
+    remove_unreferenced_definitions(root)
+    referenced = references_in(root)
+    has_text = any(element.tag in TEXT_TAGS for element in root.iter())
+
+    seen_styles = set()
+    for parent in list(root.iter()):
+        for child in list(parent):
+            if child.tag != "{%s}style" % SVG_NS:
+                continue
+            css = optimize_css(child.text or "")
+            if not css or css in seen_styles:
+                parent.remove(child)
+            else:
+                child.text = css
+                seen_styles.add(css)
+
+    for element in root.iter():
+        if element.tag not in TEXT_TAGS:
+            if element.text and not element.text.strip():
+                element.text = None
+            for child in element:
+                if child.tail and not child.tail.strip():
+                    child.tail = None
+
+        for attr, value in element.items():
+            if "}" in attr and not attr.startswith(("{%s}" % XLINK_NS,
+                                                   "{%s}" % XML_NS)):
+                del element.attrib[attr]
+            elif attr in DROPPED_ATTRIBUTES:
+                del element.attrib[attr]
+            elif attr == "{%s}space" % XML_NS and not has_text:
+                del element.attrib[attr]
+            elif attr == "id":
+                if "::" not in value and value not in referenced:
+                    del element.attrib[attr]
+            elif attr == "d":
+                element.set(attr, optimize_path(value, precision))
+            elif attr == "points":
+                numbers = r_path_number.findall(value)
+                element.set(attr, " ".join(
+                    format_number(float(n), precision) for n in numbers))
+            elif attr in COORDINATE_ATTRIBUTES and r_number.match(value):
+                element.set(attr, format_number(float(value), precision))
+            elif attr in COLOR_ATTRIBUTES:
+                element.set(attr, r_long_color.sub(r"#\1\2\3", value))
+            elif attr == "style":
+                css = optimize_css(value)
+                declarations = [declaration for declaration in css.split(";")
+                                if declaration and not
+                                declaration.startswith("enable-background")]
+                if declarations:
+                    element.set(attr, ";".join(declarations))
+                else:
+                    del element.attrib[attr]
+
+    # illustrator positions the root at 0,0 which is the default anyway
+    for attr in ("x", "y"):
+        if root.get(attr) in ("0", "0px"):
+            del root.attrib[attr]
 
-def write_tailor_config(sprite_folder, output_path):
+    return ElementTree.tostring(root)
+
+
+SPRITE_BUNDLE_PREFIX = "snoovatar-sprites"
+
+
+def sprite_bundle_chunks(tailors, bundles, split_critical):
+    """Return [(chunk name, critical, {asset_path: {dressing: svg}})]."""
+    if not split_critical:
+        return [("", False, bundles)]
+
+    critical = {}
+    for tailor in tailors:
+        if tailor["allow_clear"] or not tailor["dressings"]:
+            continue
+        asset_path = tailor["asset_path"]
+        dressing = tailor["dressings"][0]["name"]
+        critical.setdefault(asset_path, {})[dressing] = (
+            bundles[asset_path][dressing])
+
+    lazy = {}
+    for asset_path, svgs in bundles.iteritems():
+        for dressing, svg in svgs.iteritems():
+            if dressing not in critical.get(asset_path, {}):
+                lazy.setdefault(asset_path, {})[dressing] = svg
+
+    return [("-critical", True, critical), ("-lazy", False, lazy)]
+
+
+def write_sprite_bundles(sprite_folder, output_folder, tailors,
+                         split_critical=False):
+    """Write the combined sprite bundles and list them in sprites.json."""
+    bundles = {}
+    for tailor in tailors:
+        asset_path = tailor["asset_path"]
+        if asset_path not in bundles:
+            bundle_path = os.path.join(sprite_folder, asset_path,
+                                       'svg_bundle.json')
+            with open(bundle_path) as bundle_file:
+                bundles[asset_path] = json.load(bundle_file)
+
+    bundle_folder = os.path.dirname(sprite_folder)
+    sprites = []
+    for chunk, critical, svgs in sprite_bundle_chunks(
+            tailors, bundles, split_critical):
+        if not svgs:
+            continue
+        content = json.dumps(svgs, separators=(',', ':'), sort_keys=True)
+        name = "%s%s.%s.json" % (SPRITE_BUNDLE_PREFIX, chunk,
+                                 hashlib.sha1(content).hexdigest()[:12])
+        write_if_changed(os.path.join(bundle_folder, name), content)
+        sprites.append({"name": name, "critical": critical})
+
+    # hashed names mean old bundles are never overwritten, just replaced
+    current = set(sprite["name"] for sprite in sprites)
+    for path in glob.glob(os.path.join(bundle_folder,
+                                       SPRITE_BUNDLE_PREFIX + '*.json')):
+        if os.path.basename(path) not in current:
+            os.remove(path)
+
+    write_if_changed(os.path.join(output_folder, 'sprites.json'),
+                     json.dumps(sprites, indent=4, sort_keys=True))
+    return sprites
+
+
+def source_paths(directory_path):
+    paths = sorted(glob.glob(os.path.join(directory_path, '*.svg')))
+    tailor_config_path = os.path.join(directory_path, 'tailor.json')
+    if os.path.exists(tailor_config_path):
+        paths.append(tailor_config_path)
+    return paths
+
+
+def hash_sources(directory_path, previous):
+    """Return {filename: [mtime, size, sha1]} for a directory's sources.
+
+    Files whose mtime and size match the previous manifest aren't reread.
+
+    """
+
+    hashes = {}
+    for path in source_paths(directory_path):
+        filename = os.path.basename(path)
+        st = os.stat(path)
+        old = previous.get(filename)
+        if old and old[0] == st.st_mtime and old[1] == st.st_size:
+            hashes[filename] = old
+            continue
+
+        with open(path, 'rb') as source_file:
+            digest = hashlib.sha1(source_file.read()).hexdigest()
+        hashes[filename] = [st.st_mtime, st.st_size, digest]
+    return hashes
+
+
+def build_tailor(sprite_folder, directory, precision=DEFAULT_PRECISION):
+    """Bundle one sprite directory's SVGs.
+
+    Returns the directory, its tailor configs and the size of its SVGs
+    before and after optimization. precision=None skips optimization.
+
+    """
+
+    directory_path = os.path.join(sprite_folder, directory)
+
+    # each directory can contain a tailor.json file to override defaults
+    tailor_config_path = os.path.join(directory_path, 'tailor.json')
+    svgs = {}
+    tailor = None
+    try:
+        with open(tailor_config_path) as config_file:
+            tailor = json.load(config_file)
+    except IOError:
+        tailor = {}
+    if not tailor:
+        tailor = {}
+    tailor.setdefault("allow_clear", True)
+    tailor.setdefault("flip_x", False)
+    tailor.setdefault("flippable", False)
+    tailor.setdefault("name", directory)
+    tailor.setdefault("asset_path", directory)
+    tailor.setdefault("ui-order", 0)
+    tailor.setdefault("use_dynamic_color", False)
+    tailor.setdefault("z-index", 100)
+
+    tailor['dressings'] = []
+    original_size = 0
+    svg_paths = sorted(glob.glob(os.path.join(directory_path, '*.svg')))
+    for svg_path in svg_paths:
+        name = os.path.splitext(os.path.basename(svg_path))[0]
+
+        # add dressing name
+        tailor['dressings'].append({
+            "name": name
+        })
+
+        # read svg source
+        with open(svg_path, 'r') as svg_file:
+            svg = svg_file.read().replace('\n', '').replace('\r', '').strip()
+
+        original_size += len(svg)
+        if precision is not None:
+            svg = optimize_svg(svg, precision)
+        svgs[name] = svg
+
+    tailors = []
+    if tailor["flippable"]:
+        flipped_tailor = tailor.copy()
+        flipped_tailor["name"] = 'flipped_' + tailor["name"]
+        flipped_tailor["flip_x"] = True
+        flipped_tailor["ui-order"] = tailor["ui-order"] - 1;
+        flipped_tailor["z-index"] = tailor["z-index"] - 1;
+        tailors.append(flipped_tailor)
+    tailors.append(tailor)
+
+    # bundle individual SVGs together inside of each category
+    svg_bundle_output_path = os.path.join(directory_path, 'svg_bundle.json')
+    write_if_changed(svg_bundle_output_path,
+                     json.dumps(svgs, indent=4, sort_keys=True))
+
+    optimized_size = sum(len(svg) for svg in svgs.itervalues())
+    return directory, tailors, (original_size, optimized_size)
+
+
+def _build_tailor(args):
+    return build_tailor(*args)
+
+
+def write_tailor_config(sprite_folder, output_path, force=False, processes=None,
+                        precision=DEFAULT_PRECISION, split_critical=False):
     sprite_folder = os.path.abspath(sprite_folder)
     output_path = os.path.abspath(output_path)
-    sprite_directories = os.walk(sprite_folder).next()[1]
-    tailors = []
+    sprite_directories = sorted(os.walk(sprite_folder).next()[1])
 
     # make sure output folder exists
     output_folder = os.path.dirname(output_path)
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-    
+
+    manifest_path = manifest_path_for(output_path)
+    options = {"optimizer": OPTIMIZER_VERSION, "precision": precision}
+    previous = {} if force else load_manifest(manifest_path, options)
+
     # each folder == a tailor
+    manifest = {}
+    stale = []
     for directory in sprite_directories:
-        # each directory can contain a tailor.json file to override defaults
-        tailor_config_path = os.path.join(sprite_folder, directory, 'tailor.json')
-        svgs = {}
-        tailor = None
+        directory_path = os.path.join(sprite_folder, directory)
+        entry = previous.get(directory, {})
+        sources = hash_sources(directory_path, entry.get("sources", {}))
+
+        digests = {name: s[2] for name, s in sources.iteritems()}
+        previous_digests = {name: s[2] for name, s in
+                            entry.get("sources", {}).iteritems()}
+        unchanged = (
+            "tailors" in entry and
+            digests == previous_digests and
+            os.path.exists(os.path.join(directory_path, 'svg_bundle.json'))
+        )
+        if unchanged:
+            manifest[directory] = {"sources": sources, "tailors": entry["tailors"]}
+        else:
+            manifest[directory] = {"sources": sources}
+            stale.append(directory)
+
+    if len(stale) > 1 and processes != 1:
+        pool = Pool(processes)
         try:
-            with open(tailor_config_path) as config_file:
-                tailor = json.load(config_file)
-        except IOError:
-            tailor = {}        
-        if not tailor:
-            tailor = {}
-        tailor.setdefault("allow_clear", True)
-        tailor.setdefault("flip_x", False)
-        tailor.setdefault("flippable", False)
-        tailor.setdefault("name", directory)
-        tailor.setdefault("asset_path", directory)
-        tailor.setdefault("ui-order", 0)
-        tailor.setdefault("use_dynamic_color", False)
-        tailor.setdefault("z-index", 100)
-
-        tailor['dressings'] = []
-        svg_paths = glob.glob(os.path.join(sprite_folder, directory, '*.svg'))
-        for svg_path in svg_paths:
-            name = os.path.splitext(os.path.basename(svg_path))[0]
-
-            # add dressing name
-            tailor['dressings'].append({
-                "name": name
-            })
-
-            # read svg source
-            with open(svg_path, 'r') as svg_file:
-                svgs[name] = svg_file.read().replace('\n', '').replace('\r', '').strip()
-
-        if tailor["flippable"]:
-            flipped_tailor = tailor.copy()
-            flipped_tailor["name"] = 'flipped_' + tailor["name"]
-            flipped_tailor["flip_x"] = True
-            flipped_tailor["ui-order"] = tailor["ui-order"] - 1;
-            flipped_tailor["z-index"] = tailor["z-index"] - 1;
-            tailors.append(flipped_tailor)
-        tailors.append(tailor)
-
-        # bundle individual SVGs together inside of each category
-        svg_bundle_output_path = os.path.join(sprite_folder, directory, 'svg_bundle.json')
-        with open(svg_bundle_output_path, 'w') as svg_bundle:
-            json.dump(svgs, svg_bundle, indent=4)
-
-    with open(output_path, 'w') as output_file:
-        json.dump(tailors, output_file, indent=4)
+            built = pool.map(_build_tailor,
+                             [(sprite_folder, d, precision) for d in stale])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        built = [build_tailor(sprite_folder, d, precision) for d in stale]
+
+    report = []
+    for directory, tailors, (original_size, optimized_size) in built:
+        manifest[directory]["tailors"] = tailors
+        saved = original_size - optimized_size
+        report.append("  %s: %d -> %d bytes, saved %d (%.1f%%)" % (
+            directory, original_size, optimized_size, saved,
+            100. * saved / original_size if original_size else 0))
+
+    tailors = []
+    for directory in sprite_directories:
+        tailors.extend(manifest[directory]["tailors"])
+
+    write_if_changed(output_path, json.dumps(tailors, indent=4, sort_keys=True))
+    sprites = write_sprite_bundles(sprite_folder, output_folder, tailors,
+                                   split_critical)
+    write_if_changed(manifest_path, json.dumps({
+        "version": MANIFEST_VERSION,
+        "options": options,
+        "directories": manifest,
+    }, indent=4, sort_keys=True))
+
+    # the output may not have changed but it's up to date with its sources
+    os.utime(output_path, None)
+
+    summary = "rebuilt %d of %d tailors" % (len(stale), len(sprite_directories))
+    bundles = "sprite bundles: %s" % ", ".join(s["name"] for s in sprites)
+    return "\n".join([summary] + report + [bundles])
 
 
 if __name__ == '__main__':
     import sys
-    print write_tailor_config(sys.argv[1], sys.argv[2])
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = dict(arg[2:].partition("=")[::2] for arg in sys.argv[1:]
+                 if arg.startswith("--"))
+
+    if "no-optimize" in flags:
+        precision = None
+    else:
+        precision = int(flags.get("precision", DEFAULT_PRECISION))
+
+    print write_tailor_config(args[0], args[1], force="force" in flags,
+                              precision=precision,
+                              split_critical="split-critical" in flags)
@@ -0,0 +1,57 @@
+import unittest
+
+from reddit_gold.compositor import SnoovatarCompositor, color_luminance
+
+
+BODY_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 400">'
+    '<path id="fill::body" d="M0 0h10v10z"/>'
+    '<path id="body-f:darker::fill::shade" d="M0 0h5v5z"/>'
+    '</svg>'
+)
+
+
+def make_compositor(use_dynamic_color=False):
+    tailors = [{
+        "name": "body",
+        "asset_path": "body",
+        "z-index": 0,
+        "flip_x": False,
+        "allow_clear": False,
+        "use_dynamic_color": use_dynamic_color,
+        "dressings": [{"name": "body"}],
+    }]
+    return SnoovatarCompositor(tailors, {"body": {"body": BODY_SVG}})
+
+
+def snoovatar(color, snoo_color=None):
+    return {
+        "public": True,
+        "snoo_color": snoo_color,
+        "components": {"body": {"dressingName": "body", "color": color}},
+    }
+
+
+class SnoovatarCompositorTest(unittest.TestCase):
+    def test_hex_color(self):
+        svg = make_compositor().compose(snoovatar("#ff0000"))
+        self.assertIn('fill="#ff0000"', svg)
+        self.assertIn('fill="%s"' % color_luminance("#ff0000", -.3), svg)
+
+    def test_non_hex_colors_are_ignored(self):
+        compositor = make_compositor()
+        for color in ("red", "#12", "url(http://example.com/)", 12):
+            svg = compositor.compose(snoovatar(color))
+            self.assertNotIn("fill=", svg)
+
+    def test_non_hex_dynamic_color_falls_back(self):
+        compositor = make_compositor(use_dynamic_color=True)
+        svg = compositor.compose(snoovatar("red", snoo_color="#00ff00"))
+        self.assertIn('fill="#00ff00"', svg)
+
+        svg = compositor.compose(snoovatar("red", snoo_color="url(#x)"))
+        self.assertIn('fill="#ffffff"', svg)
+
+
+if __name__ == "__main__":
+    unittest.main()
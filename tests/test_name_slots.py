@@ -0,0 +1,127 @@
+import collections
+import itertools
+import os
+import unittest
+
+from reddit_gold.name_slots import NameSlots, NoSlotsAvailable
+
+
+ZnodeStat = collections.namedtuple("ZnodeStat", ["mtime"])
+
+
+class NoNodeError(Exception):
+    pass
+
+
+class FakeZooKeeper(object):
+    """An in-memory stand-in for the parts of KazooClient NameSlots uses."""
+
+    def __init__(self):
+        self.nodes = {}
+        self.children_watches = {}
+        self.data_watches = {}
+        self.clock = itertools.count(1)
+        self.fail_sets = False
+
+    def create(self, path, data=""):
+        self.nodes[path] = (data, next(self.clock))
+        self._fire_children(os.path.dirname(path))
+        self._fire_data(path)
+
+    def delete(self, path):
+        del self.nodes[path]
+        self._fire_data(path)
+        self._fire_children(os.path.dirname(path))
+
+    def get_children(self, path):
+        return sorted(os.path.basename(node) for node in self.nodes
+                      if os.path.dirname(node) == path)
+
+    def get(self, path):
+        if path not in self.nodes:
+            raise NoNodeError(path)
+        data, mtime = self.nodes[path]
+        return data, ZnodeStat(mtime)
+
+    def set(self, path, data):
+        if self.fail_sets:
+            raise IOError("connection lost")
+        if path not in self.nodes:
+            raise NoNodeError(path)
+        self.nodes[path] = (data, next(self.clock))
+        self._fire_data(path)
+        return ZnodeStat(self.nodes[path][1])
+
+    def ChildrenWatch(self, path, func):
+        self.children_watches.setdefault(path, []).append(func)
+        func(self.get_children(path))
+
+    def DataWatch(self, path, func):
+        self.data_watches.setdefault(path, []).append(func)
+        self._call_data_watch(path, func)
+
+    def _call_data_watch(self, path, func):
+        if path in self.nodes:
+            data, stat = self.get(path)
+        else:
+            data, stat = None, None
+        if func(data, stat) is False:
+            self.data_watches[path].remove(func)
+
+    def _fire_children(self, path):
+        for func in list(self.children_watches.get(path, [])):
+            func(self.get_children(path))
+
+    def _fire_data(self, path):
+        for func in list(self.data_watches.get(path, [])):
+            self._call_data_watch(path, func)
+
+
+class NameSlotsTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeZooKeeper()
+        self.root = "/gold/server-names"
+        for slot_name in ("a", "b", "c"):
+            self.client.create(os.path.join(self.root, slot_name))
+        self.slots = NameSlots(self.client, root=self.root)
+
+    def path(self, slot_name):
+        return os.path.join(self.root, slot_name)
+
+    def test_prefers_empty_slots(self):
+        assigned = [self.slots.assign("name %d" % i) for i in xrange(3)]
+        self.assertEqual(
+            sorted(assigned), [self.path(name) for name in "abc"])
+
+    def test_reuses_least_recently_modified(self):
+        for i in xrange(3):
+            self.slots.assign("name %d" % i)
+        self.client.set(self.path("b"), "changed elsewhere")
+
+        self.assertNotEqual(self.slots.assign("next"), self.path("b"))
+
+    def test_follows_children(self):
+        self.client.delete(self.path("a"))
+        self.client.delete(self.path("b"))
+        self.client.create(self.path("d"), "taken")
+
+        self.assertEqual(self.slots.assign("name"), self.path("c"))
+        self.assertEqual(self.slots.assign("name"), self.path("d"))
+
+    def test_no_slots(self):
+        for slot_name in "abc":
+            self.client.delete(self.path(slot_name))
+        self.assertRaises(NoSlotsAvailable, self.slots.assign, "name")
+
+    def test_failed_set_keeps_slot(self):
+        self.client.fail_sets = True
+        self.assertRaises(IOError, self.slots.assign, "name")
+
+        self.client.fail_sets = False
+        assigned = [self.slots.assign("name %d" % i) for i in xrange(3)]
+        self.assertEqual(
+            sorted(assigned), [self.path(name) for name in "abc"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from reddit_gold import Gold
+
+
+# extensions r2's ExtensionMiddleware takes off the path before routing
+# and exposes as c.extension/c.render_style instead.
+STRIPPED_EXTENSIONS = ("json", "xml", "rss", "api", "compact", "png", "css")
+
+
+class RecordingMapper(object):
+    def __init__(self):
+        self.routes = []
+
+    def __call__(self, path, **kwargs):
+        self.routes.append((path, kwargs))
+
+    def match(self, path):
+        """Return the route r2 would dispatch a request for path to."""
+        base, dot, extension = path.rpartition(".")
+        if dot and extension in STRIPPED_EXTENSIONS:
+            path = base
+
+        segments = path.strip("/").split("/")
+        for route, kwargs in self.routes:
+            route_segments = route.strip("/").split("/")
+            if len(route_segments) != len(segments):
+                continue
+            if all(r.startswith(":") or r == s
+                   for r, s in zip(route_segments, segments)):
+                return kwargs
+        return None
+
+
+class GoldRoutesTest(unittest.TestCase):
+    def setUp(self):
+        self.mapper = RecordingMapper()
+        Gold.__new__(Gold).add_routes(self.mapper)
+
+    def assertRoutesTo(self, path, action):
+        route = self.mapper.match(path)
+        self.assertTrue(route, "%s isn't routed" % path)
+        self.assertEqual((route["controller"], route["action"]),
+                         ("gold", action))
+
+    def test_snoovatar_routes(self):
+        self.assertRoutesTo("/user/foo/snoo", "snoovatar")
+        self.assertRoutesTo("/user/foo/snoo.svg", "snoovatar_svg")
+        # served by GET_snoovatar when c.render_style is png
+        self.assertRoutesTo("/user/foo/snoo.png", "snoovatar")
+
+    def test_no_routes_need_stripped_extensions(self):
+        for path, kwargs in self.mapper.routes:
+            extension = path.rpartition("/")[2].rpartition(".")[2]
+            self.assertNotIn(extension, STRIPPED_EXTENSIONS, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
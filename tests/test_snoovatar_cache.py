@@ -0,0 +1,223 @@
+import collections
+import json
+import unittest
+
+from reddit_gold import models
+from reddit_gold.models import SnoovatarsByAccount
+from reddit_gold.snoovatar_codec import SnoovatarCodec
+
+
+TAILORS = [
+    {"name": "body", "dressings": [{"name": "body"}]},
+    {"name": "hat", "dressings": [{"name": "cap"}, {"name": "fez"}]},
+]
+
+
+class FakeCache(object):
+    """An in-memory stand-in for g.cache."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def get_multi(self, keys):
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set(self, key, value, time=0):
+        self.data[key] = value
+
+    def set_multi(self, values, time=0):
+        self.data.update(values)
+
+
+class FakeStats(object):
+    def __init__(self):
+        self.events = collections.Counter()
+
+    def simple_event(self, name, delta=1):
+        self.events[name] += delta
+
+
+class FakeGlobals(object):
+    def __init__(self):
+        self.cache = FakeCache()
+        self.stats = FakeStats()
+
+
+class FakeCatalogue(object):
+    codec = SnoovatarCodec(TAILORS)
+
+
+class FakeFeature(object):
+    def __init__(self):
+        self.enabled = set(["snoovatar_packed_storage"])
+
+    def is_enabled(self, name):
+        return name in self.enabled
+
+
+class FakeRows(object):
+    """An in-memory stand-in for SnoovatarsByAccount's column family."""
+
+    def __init__(self):
+        self.rows = {}
+        self.reads = 0
+        self.writes = 0
+
+    def _byID(self, ids, properties=None):
+        self.reads += 1
+        if isinstance(ids, basestring):
+            if ids not in self.rows:
+                raise models.tdb_cassandra.NotFound
+            return dict(self.rows[ids])
+        return {id36: dict(self.rows[id36]) for id36 in ids
+                if id36 in self.rows}
+
+    def _set_values(self, id36, values):
+        self.writes += 1
+        self.rows.setdefault(id36, {}).update(values)
+
+
+class FakeAccount(object):
+    def __init__(self, id36):
+        self._id36 = id36
+        self.pref_show_snoovatar = False
+        self.commits = 0
+
+    def _commit(self):
+        self.commits += 1
+
+
+class SnoovatarCacheTest(unittest.TestCase):
+    def patch(self, obj, attr, value):
+        missing = object()
+        original = obj.__dict__.get(attr, missing)
+        setattr(obj, attr, value)
+
+        def restore():
+            if original is missing:
+                delattr(obj, attr)
+            else:
+                setattr(obj, attr, original)
+        self.addCleanup(restore)
+
+    def setUp(self):
+        self.g = FakeGlobals()
+        self.cassandra = FakeRows()
+        self.feature = FakeFeature()
+        self.patch(models, "g", self.g)
+        self.patch(models, "feature", self.feature)
+        self.patch(models, "get_tailor_catalogue", lambda: FakeCatalogue)
+        self.patch(SnoovatarsByAccount, "_byID",
+                   staticmethod(self.cassandra._byID))
+        self.patch(SnoovatarsByAccount, "_set_values",
+                   staticmethod(self.cassandra._set_values))
+        self.user = FakeAccount("abc")
+
+    def save(self, user, public=True, snoo_color="#FFF"):
+        SnoovatarsByAccount.save(
+            user=user,
+            name="snoo",
+            public=public,
+            snoo_color=snoo_color,
+            components={"body": {"dressingName": "body"}, "hat": None},
+        )
+
+    def test_miss_then_hit(self):
+        self.save(self.user)
+        self.g.cache.data.clear()
+
+        snoovatar = SnoovatarsByAccount.load(self.user, "snoo")
+        self.assertEqual(self.cassandra.reads, 1)
+        self.assertEqual(self.g.stats.events["snoovatar.cache.miss"], 1)
+
+        self.assertEqual(SnoovatarsByAccount.load(self.user, "snoo"),
+                         snoovatar)
+        self.assertEqual(self.cassandra.reads, 1)
+        self.assertEqual(self.g.stats.events["snoovatar.cache.hit"], 1)
+
+    def test_missing_snoovatar_is_cached(self):
+        self.assertEqual(SnoovatarsByAccount.load(self.user, "snoo"), {})
+        self.assertEqual(SnoovatarsByAccount.load(self.user, "snoo"), {})
+        self.assertEqual(self.cassandra.reads, 1)
+        self.assertEqual(self.g.stats.events["snoovatar.cache.hit"], 1)
+
+    def test_save_replaces_cached_missing_entry(self):
+        self.assertEqual(SnoovatarsByAccount.load(self.user, "snoo"), {})
+        self.save(self.user)
+
+        snoovatar = SnoovatarsByAccount.load(self.user, "snoo")
+        self.assertTrue(snoovatar["public"])
+        self.assertEqual(self.cassandra.reads, 1)
+
+    def test_save_then_load_matches_uncached_load(self):
+        self.save(self.user, snoo_color="#ABC")
+        cached = SnoovatarsByAccount.load(self.user, "snoo")
+        self.assertEqual(self.cassandra.reads, 0)
+
+        self.g.cache.data.clear()
+        self.assertEqual(SnoovatarsByAccount.load(self.user, "snoo"), cached)
+        self.assertEqual(self.cassandra.reads, 1)
+        self.assertTrue(self.user.pref_show_snoovatar)
+
+    def test_load_multi(self):
+        users = [FakeAccount(id36) for id36 in ("a", "b", "c")]
+        self.save(users[0])
+        self.g.cache.data.clear()
+        self.cassandra.rows["b"] = {"snoo": json.dumps({
+            "public": False,
+            "snoo_color": "",
+            "components": {"hat": {"dressingName": "fez"}},
+        })}
+        writes = self.cassandra.writes
+
+        snoovatars = SnoovatarsByAccount.load_multi(users, "snoo")
+        self.assertEqual(snoovatars["a"],
+                         SnoovatarsByAccount.load(users[0], "snoo"))
+        self.assertEqual(snoovatars["b"]["components"],
+                         {"hat": {"dressingName": "fez"}})
+        self.assertEqual(snoovatars["c"], {})
+        self.assertEqual(self.cassandra.reads, 1)
+
+        # json rows aren't repacked from the batch path
+        self.assertEqual(self.cassandra.writes, writes)
+
+        SnoovatarsByAccount.load_multi(users, "snoo")
+        self.assertEqual(self.cassandra.reads, 1)
+
+    def test_json_rows_are_repacked_when_loaded(self):
+        self.cassandra.rows[self.user._id36] = {"snoo": json.dumps({
+            "public": True,
+            "snoo_color": "#FFF",
+            "components": {"hat": {"dressingName": "fez"}},
+        })}
+
+        snoovatar = SnoovatarsByAccount.load(self.user, "snoo")
+        raw = self.cassandra.rows[self.user._id36]["snoo"]
+        self.assertTrue(SnoovatarCodec.is_packed(raw))
+        self.assertEqual(FakeCatalogue.codec.decode(raw)["components"],
+                         snoovatar["components"])
+
+    def test_packing_off(self):
+        self.feature.enabled.clear()
+        row = json.dumps({
+            "public": True,
+            "snoo_color": "",
+            "components": {"hat": {"dressingName": "fez"}},
+        })
+        self.cassandra.rows[self.user._id36] = {"snoo": row}
+
+        SnoovatarsByAccount.load(self.user, "snoo")
+        self.assertEqual(self.cassandra.rows[self.user._id36]["snoo"], row)
+
+        self.save(self.user)
+        raw = self.cassandra.rows[self.user._id36]["snoo"]
+        self.assertFalse(SnoovatarCodec.is_packed(raw))
+        self.assertEqual(json.loads(raw),
+                         SnoovatarsByAccount.load(self.user, "snoo"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import base64
+import json
+import unittest
+
+from reddit_gold.snoovatar_codec import SnoovatarCodec
+
+
+TAILORS = [
+    {"name": "body", "dressings": [{"name": "body"}]},
+    {"name": "hat", "dressings": [{"name": "cap"}, {"name": "fez"}]},
+    {"name": "glasses", "dressings": [{"name": "monocle"}]},
+]
+
+SNOOVATAR = {
+    "public": True,
+    "snoo_color": "#a1b2c3",
+    "components": {
+        "body": {"dressingName": "body", "color": "#ffffff"},
+        "hat": {"dressingName": "fez", "color": "#123456",
+                "altColor": "#654321"},
+        "glasses": None,
+    },
+}
+
+
+class SnoovatarCodecTest(unittest.TestCase):
+    def setUp(self):
+        self.codec = SnoovatarCodec(TAILORS)
+
+    def test_round_trip(self):
+        raw = self.codec.encode(SNOOVATAR)
+        self.assertTrue(self.codec.is_packed(raw))
+        self.assertLess(len(raw), len(json.dumps(SNOOVATAR)))
+        self.assertEqual(self.codec.decode(raw), SNOOVATAR)
+
+    def test_json_rows(self):
+        self.assertEqual(self.codec.decode(json.dumps(SNOOVATAR)), SNOOVATAR)
+
+    def test_unpackable_snoovatars_stay_json(self):
+        for snoovatar in (
+            dict(SNOOVATAR, extra=1),
+            dict(SNOOVATAR, snoo_color="red"),
+            dict(SNOOVATAR, components={"cape": {"dressingName": "red"}}),
+            dict(SNOOVATAR, components={"hat": {"dressingName": "bowler"}}),
+        ):
+            raw = self.codec.encode(snoovatar)
+            self.assertFalse(self.codec.is_packed(raw))
+            self.assertEqual(self.codec.decode(raw), snoovatar)
+
+    def test_colors_are_normalized(self):
+        snoovatar = dict(SNOOVATAR, snoo_color="#AbC", components={
+            "body": {"dressingName": "body", "color": "#FFF"},
+        })
+        decoded = self.codec.decode(self.codec.encode(snoovatar))
+        self.assertEqual(decoded["snoo_color"], "#aabbcc")
+        self.assertEqual(decoded["components"]["body"]["color"], "#ffffff")
+
+    def test_unknown_tailors_and_dressings_survive(self):
+        raw = self.codec.encode(SNOOVATAR)
+
+        # the hat's fez and the glasses go away
+        smaller = SnoovatarCodec([
+            {"name": "body", "dressings": [{"name": "body"}]},
+            {"name": "hat", "dressings": [{"name": "cap"}]},
+        ])
+        decoded = smaller.decode(raw)
+        self.assertEqual(decoded["components"]["body"],
+                         SNOOVATAR["components"]["body"])
+        fez = decoded["components"]["hat"]["dressingName"]
+        self.assertTrue(smaller.r_unknown_name.match(fez))
+        self.assertEqual(len(decoded["components"]), 3)
+
+        # and come back
+        repacked = smaller.encode(decoded)
+        self.assertEqual(repacked, raw)
+        self.assertEqual(self.codec.decode(repacked), SNOOVATAR)
+
+    def test_unknown_version(self):
+        data = base64.b64decode(self.codec.encode(SNOOVATAR))
+        raw = base64.b64encode(chr(SnoovatarCodec.VERSION + 1) + data[1:])
+        self.assertRaises(ValueError, self.codec.decode, raw)
+
+
+if __name__ == "__main__":
+    unittest.main()